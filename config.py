@@ -7,6 +7,45 @@ def load_config():
         'PROVIDER': os.getenv('PROVIDER', 'openai'),  # Default to 'openai'
         'HOST': os.getenv('HOST', 'https://api.openai.com'),
         'API_KEY': os.getenv('API_KEY'),
+        'MODEL': os.getenv('MODEL'),  # Defaults to 'gpt-3.5-turbo' with openai, required with ollama
+        'REQUEST_TIMEOUT': float(os.getenv('REQUEST_TIMEOUT', 120)),  # Seconds before an LLM request times out
+        'MAX_RETRIES': int(os.getenv('MAX_RETRIES', 3)),  # Retries on timeouts, 429 and 5xx responses
+        'PROVIDER_CONCURRENCY': int(os.getenv('PROVIDER_CONCURRENCY', 8)),  # Concurrent requests per provider
+        'PROVIDER_RPM': float(os.getenv('PROVIDER_RPM', 0)),  # Requests per minute per provider, 0 disables the limit
+        'PROVIDER_TPM': float(os.getenv('PROVIDER_TPM', 0)),  # Estimated tokens per minute per provider, 0 disables the limit
+        'BACKENDS': os.getenv('BACKENDS', ''),  # JSON list of the providers to route the requests to
+        'FAILOVER_COOLDOWN': float(os.getenv('FAILOVER_COOLDOWN', 30)),  # Seconds a failing backend is skipped
         'OUTPUT_PATH': os.getenv('OUTPUT_PATH', 'output'),  # Default to 'output',
-        'IMAGES_PATH': os.getenv('IMAGES_PATH', 'images')  # Default to 'images'
+        'IMAGES_PATH': os.getenv('IMAGES_PATH', 'images'),  # Default to 'images'
+        'TEMPLATE': os.getenv('TEMPLATE', 'templates/template0.pptx'),
+        'MAX_WORKERS': int(os.getenv('MAX_WORKERS', 4)),  # Concurrent slide expansions, 1 disables concurrency
+        'STREAMING': os.getenv('STREAMING', 'false').lower() == 'true',  # Expand slides while the outline streams
+        'BATCH_SIZE': int(os.getenv('BATCH_SIZE', 1)),  # Slide texts requested per LLM call, 1 disables batching
+        'INCREMENTAL': os.getenv('INCREMENTAL', 'false').lower() == 'true',  # Reuse the slides whose inputs did not change
+        'DECK_CACHE': os.getenv('DECK_CACHE', 'true').lower() == 'true',  # Serve repeated presentations from the deck cache, on by default
+        'DECK_CACHE_TTL': int(os.getenv('DECK_CACHE_TTL', 86400)),  # Lifetime in seconds of a cached presentation, 0 for unlimited
+        'LARGE_DECK': os.getenv('LARGE_DECK', 'false').lower() == 'true',  # Checkpoint the slides and stream the images into the file
+        'IMAGE_WORKERS': int(os.getenv('IMAGE_WORKERS', 4)),  # Concurrent image downloads
+        'IMAGE_PROCESSING': os.getenv('IMAGE_PROCESSING', 'true').lower() == 'true',  # Resize images to their placeholder
+        'IMAGE_DPI': int(os.getenv('IMAGE_DPI', 150)),  # Resolution of the resized images
+        'IMAGE_QUALITY': int(os.getenv('IMAGE_QUALITY', 85)),  # JPEG quality of the resized images
+        'WEB_SEARCH_LLM_FORMAT': os.getenv('WEB_SEARCH_LLM_FORMAT', 'true').lower() == 'true',  # Format the web context with the LLM
+        'CONTEXT_TOKEN_BUDGET': int(os.getenv('CONTEXT_TOKEN_BUDGET', 1500)),  # Web context tokens in the outline prompt, 0 for unlimited
+        'PROMPT_TOKEN_BUDGET': int(os.getenv('PROMPT_TOKEN_BUDGET', 0)),  # Outline prompt tokens, 0 for unlimited
+        'WEB_CACHE_TTL': int(os.getenv('WEB_CACHE_TTL', 86400)),  # Lifetime in seconds of a cached web context
+        'SERVER_WORKERS': int(os.getenv('SERVER_WORKERS', 2)),  # Presentations generated concurrently by the service
+        'SERVER_QUEUE_SIZE': int(os.getenv('SERVER_QUEUE_SIZE', 16)),  # Jobs waiting in the service queue
+        'CACHE_MAX_BYTES': int(os.getenv('CACHE_MAX_BYTES', 0)),  # LLM cache size limit, 0 for unlimited
+        'CACHE_MAX_AGE': int(os.getenv('CACHE_MAX_AGE', 0)),  # LLM cache entry lifetime in seconds, 0 for unlimited
+        'IMAGES_MAX_BYTES': int(os.getenv('IMAGES_MAX_BYTES', 0)),  # Image files size limit applied by the maintenance, 0 for unlimited
+        'MAINTENANCE_GRACE': int(os.getenv('MAINTENANCE_GRACE', 3600)),  # Seconds recent files and cache entries are kept by the maintenance
+        'MEMORY_CACHE_ENTRIES': int(os.getenv('MEMORY_CACHE_ENTRIES', 1024)),  # In-memory LLM cache size, 0 disables it
+        'MEMORY_CACHE_BYTES': int(os.getenv('MEMORY_CACHE_BYTES', 64 * 1024 * 1024)),  # In-memory LLM cache limit in bytes
+        'SIMILARITY_CACHE': os.getenv('SIMILARITY_CACHE', 'false').lower() == 'true',  # Reuse the texts of similar slides
+        'SIMILARITY_THRESHOLD': float(os.getenv('SIMILARITY_THRESHOLD', 0.85)),  # Minimum similarity of a reused slide text
+        'SIMILARITY_MAX_ENTRIES': int(os.getenv('SIMILARITY_MAX_ENTRIES', 100000)),  # Slide texts kept by the similarity cache, 0 for unlimited
+        'SIMILARITY_MAX_AGE': int(os.getenv('SIMILARITY_MAX_AGE', 0)),  # Lifetime in seconds of a similarity cache entry, 0 for unlimited
+        'TRACING': os.getenv('TRACING', 'false').lower() == 'true',  # Record spans and metrics of the pipeline
+        'TRACE_FILE': os.getenv('TRACE_FILE', ''),  # Chrome trace JSON written after a generation
+        'TRACE_MAX_EVENTS': int(os.getenv('TRACE_MAX_EVENTS', 100000))  # Spans kept in memory for the trace
     }
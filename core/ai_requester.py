@@ -1,7 +1,75 @@
-import openai
-import requests
-import json
 import os
+import re
+from core.cache_store import CacheStore
+from core.memory_cache import LRUCache
+from core.prompt_budget import PromptBudget
+from core.provider_router import create_router
+from core.providers import configured_model
+from core.similarity_cache import SimilarityCache
+from core.single_flight import SingleFlight
+from core.tracing import estimate_tokens, tracer
+
+# Fixed instructions of the outline prompt, shared by all the outlines as a cacheable prefix
+OUTLINE_INSTRUCTIONS = """You are allowed to use the following slide types:
+Title Slide - (Title, Subtitle)
+Content Slide - (Title, Content)
+Two Content Slide - (Title, Content Left, Content Right)
+Image Slide - (Title, Content, Image)
+Thanks Slide - (Title)
+
+Put this tag before the Title Slide: [L_TS]
+Put this tag before the Content Slide: [L_CS]
+Put this tag before the Two Content Slide: [L_TCS]
+Put this tag before the Image Slide: [L_IS]
+Put this tag before the Thanks Slide: [L_THS]
+
+Put this tag before the Title: [TITLE]
+Put this tag after the Title: [/TITLE]
+Put this tag before the Subtitle: [SUBTITLE]
+Put this tag after the Subtitle: [/SUBTITLE]
+Put this tag before the Content: [CONTENT]
+Put this tag after the Content: [/CONTENT]
+Put this tag before the Image: [IMAGE]
+Put this tag after the Image: [/IMAGE]
+
+Put "[SLIDEBREAK]" after each slide
+
+For example:
+[L_TS]
+[TITLE]Among Us[/TITLE]
+
+[SLIDEBREAK]
+
+[L_CS]
+[TITLE]What Is Among Us?[/TITLE]
+[CONTENT]
+1. Among Us is a popular online multiplayer game developed and published by InnerSloth.
+2. The game is set in a space-themed setting where players take on the roles of Crewmates and Impostors.
+3. The objective of Crewmates is to complete tasks and identify the Impostors among them, while the Impostors' goal is to sabotage the spaceship and eliminate the Crewmates without being caught.
+[/CONTENT]
+
+[SLIDEBREAK]
+
+[L_TCS]
+[TITLE]Gameplay[/TITLE]
+[CONTENT]
+- Crewmates must work together to complete tasks around the map while Impostors attempt to eliminate
+- Impostors can use vents to move around the map quickly and sabotage the Crewmates' efforts
+[/CONTENT]
+[CONTENT]
+- Meetings are called when a player reports a dead body or calls an emergency meeting
+- Players discuss and vote on who they believe is the Impostor
+[/CONTENT]
+
+
+[SLIDEBREAK]
+
+Elaborate on the Content, provide as much information as possible.
+REMEMBER TO PLACE a [/CONTENT] at the end of the Content.
+Do not include any special characters (?, !, ., :, ) in the Title.
+Do not include any additional information in your response and stick to the format.
+
+"""
 
 class AIRequester:
     def __init__(self, config):
@@ -11,87 +79,54 @@ class AIRequester:
         self.provider = config['PROVIDER']
         self.host = config['HOST']
         self.api_key = config['API_KEY']
+        self.model = configured_model(config)
         self.config = config
-        self.cache_file = os.path.join(config['OUTPUT_PATH'], 'cache.json')
-
-        if self.provider == 'openai':
-            openai.api_key = self.api_key
-            openai.base_url = self.host
+        self.cache = CacheStore(os.path.join(config['OUTPUT_PATH'], 'cache.db'),
+                                max_bytes=config.get('CACHE_MAX_BYTES', 0),
+                                max_age=config.get('CACHE_MAX_AGE', 0))
+        # In-process cache in front of the persistent one, disabled when MEMORY_CACHE_ENTRIES is 0
+        memory_entries = config.get('MEMORY_CACHE_ENTRIES', 1024)
+        self.memory_cache = LRUCache(memory_entries, config.get('MEMORY_CACHE_BYTES', 0)) if memory_entries else None
+        # Cache of the slide texts of similar slides, disabled unless SIMILARITY_CACHE is true
+        self.similarity_cache = None
+        if config.get('SIMILARITY_CACHE', False):
+            self.similarity_cache = SimilarityCache(os.path.join(config['OUTPUT_PATH'], 'similarity.db'),
+                                                    threshold=config.get('SIMILARITY_THRESHOLD', 0.85),
+                                                    max_entries=config.get('SIMILARITY_MAX_ENTRIES', 100000),
+                                                    max_age=config.get('SIMILARITY_MAX_AGE', 0))
+        # Token counter and context budget of the outline prompt
+        self.prompt_budget = PromptBudget(config)
+        # Router of the provider clients, each one with its own credentials and pooled connections
+        self.backend = create_router(config)
+        # Concurrent requests of the same prompt share a single backend request
+        self.flights = SingleFlight()
 
-        # Create the cache file if it doesn't exist
-        if not os.path.exists(self.cache_file):
-            with open(self.cache_file, 'w') as f:
-                json.dump({}, f)
+        # Import the responses cached by previous versions, they were given by the configured provider and model
+        self.cache.migrate_json(os.path.join(config['OUTPUT_PATH'], 'cache.json'),
+                                lambda message: '\n'.join(self.cache_key(message, 'expansion')))
 
     def create_prompt(self, topic, slide_length, context=''):
         """
         Create a prompt for the AI model based on the topic and slide length.
         """
-        return f"""Create an outline for a slideshow presentation on the topic of {topic} which is {slide_length}
-        slides long. Make sure it is {slide_length} long.
-
-        You are allowed to use the following slide types:
-        Title Slide - (Title, Subtitle)
-        Content Slide - (Title, Content)
-        Two Content Slide - (Title, Content Left, Content Right)
-        Image Slide - (Title, Content, Image)
-        Thanks Slide - (Title)
-
-        Put this tag before the Title Slide: [L_TS]
-        Put this tag before the Content Slide: [L_CS]
-        Put this tag before the Two Content Slide: [L_TCS]
-        Put this tag before the Image Slide: [L_IS]
-        Put this tag before the Thanks Slide: [L_THS]
-        
-        Put this tag before the Title: [TITLE]
-        Put this tag after the Title: [/TITLE]
-        Put this tag before the Subtitle: [SUBTITLE]
-        Put this tag after the Subtitle: [/SUBTITLE]
-        Put this tag before the Content: [CONTENT]
-        Put this tag after the Content: [/CONTENT]
-        Put this tag before the Image: [IMAGE]
-        Put this tag after the Image: [/IMAGE]
-
-        Put "[SLIDEBREAK]" after each slide 
-
-        For example:
-        [L_TS]
-        [TITLE]Among Us[/TITLE]
-
-        [SLIDEBREAK]
-
-        [L_CS] 
-        [TITLE]What Is Among Us?[/TITLE]
-        [CONTENT]
-        1. Among Us is a popular online multiplayer game developed and published by InnerSloth.
-        2. The game is set in a space-themed setting where players take on the roles of Crewmates and Impostors.
-        3. The objective of Crewmates is to complete tasks and identify the Impostors among them, while the Impostors' goal is to sabotage the spaceship and eliminate the Crewmates without being caught.
-        [/CONTENT]
-
-        [SLIDEBREAK]
-
-        [L_TCS]
-        [TITLE]Gameplay[/TITLE]
-        [CONTENT]
-        - Crewmates must work together to complete tasks around the map while Impostors attempt to eliminate
-        - Impostors can use vents to move around the map quickly and sabotage the Crewmates' efforts
-        [/CONTENT]
-        [CONTENT]
-        - Meetings are called when a player reports a dead body or calls an emergency meeting
-        - Players discuss and vote on who they believe is the Impostor
-        [/CONTENT]
-
-
-        [SLIDEBREAK]
-
-        Elaborate on the Content, provide as much information as possible.
-        REMEMBER TO PLACE a [/CONTENT] at the end of the Content.
-        Do not include any special characters (?, !, ., :, ) in the Title.
-        Do not include any additional information in your response and stick to the format.
-        
-        Context:
-        {context}
+        return self.create_outline_prompt(topic, slide_length, context)[0]
+
+    def create_outline_prompt(self, topic, slide_length, context=''):
         """
+        Create the outline prompt and return it with its token counts.
+        The fixed instructions come first so that providers can cache the prompt prefix,
+        the topic and the web context, trimmed to the token budget, come last.
+        """
+        request = f"""Create an outline for a slideshow presentation on the topic of {topic} which is {slide_length}
+slides long. Make sure it is {slide_length} long.
+
+Context:
+"""
+        fixed_tokens = self.prompt_budget.counter.count(OUTLINE_INSTRUCTIONS + request)
+        context, stats = self.prompt_budget.fit(context, topic, fixed_tokens)
+        prompt = OUTLINE_INSTRUCTIONS + request + context
+        stats['prompt_tokens'] = self.prompt_budget.counter.count(prompt)
+        return prompt, stats
 
     def create_slide_prompt(self, slide_type, title, content):
         """
@@ -114,60 +149,240 @@ class AIRequester:
         Do not use introductory phrases like "Here is the revised," "Here is the updated," etc.
         """
         
-    def request_ai(self, message):
+    def create_batch_slide_prompt(self, slides):
+        """
+        Create a single prompt for the AI model to generate the text of several slides.
+        Each slide is a (slide_type, title, content) tuple, the texts are expected back between [RESULT n] tags.
+        """
+        sections = "\n\n        ".join(
+            f"[SLIDE {number}]\n        Slide type: {slide_type}\n        {title}\n        {content}\n        [/SLIDE {number}]"
+            for number, (slide_type, title, content) in enumerate(slides, start=1)
+        )
+        return f"""Create a short slide text for each of the following {len(slides)} slides:
+
+        {sections}
+
+        Example:
+        The world of AI is vast and ever-evolving. From self-driving cars to virtual assistants, AI has transformed the way we live and work. In this slide, we will explore the impact of AI on various industries and its potential for the future.
+        All developer teams should be using the same AI model to generate the content for the slides.
+        It is a good idea to have a consistent style and tone throughout the presentation.
+
+        Put the text of each slide between [RESULT n] and [/RESULT n], where n is the slide number, for example:
+        [RESULT 1]
+        The text of the first slide.
+        [/RESULT 1]
+
+        Do not include any special markdown characters (*, #) in the content.
+        Do not include any additional information in your response and stick to the format.
+        Do not use introductory phrases like "Here is the revised," "Here is the updated," etc.
+        """
+
+    def parse_batch_response(self, response, count):
+        """
+        Extract the slide texts from a batch response, or return None if the response is malformed.
+        """
+        results = {}
+        for match in re.finditer(r"\[RESULT (\d+)\](.*?)\[/RESULT \1\]", response, re.DOTALL):
+            text = match.group(2).strip()
+            if text:
+                results[int(match.group(1))] = text
+
+        if any(number not in results for number in range(1, count + 1)):
+            return None
+        return [results[number] for number in range(1, count + 1)]
+
+    def request_ai_batch(self, slides, job=None):
+        """
+        Get the texts of several slides with a single request, each slide is a (slide_type, title, content) tuple.
+        Falls back to one request per slide if the batch response is malformed.
+        Slides similar to a previous slide are not requested when the similarity cache is enabled.
+        """
+        if self.similarity_cache is not None:
+            texts = [self._get_similar_text(*slide) for slide in slides]
+            missing = [index for index, text in enumerate(texts) if text is None]
+            if missing:
+                for index, text in zip(missing, self._request_batch_texts([slides[index] for index in missing], job)):
+                    texts[index] = text
+                    self._set_similar_text(*slides[index], text)
+            return texts
+
+        return self._request_batch_texts(slides, job)
+
+    def _request_batch_texts(self, slides, job=None):
+        """
+        Request the texts of several slides with a single request, or one by one if the response is malformed.
+        """
+        if len(slides) > 1:
+            response = self.request_ai(self.create_batch_slide_prompt(slides), job=job)
+            texts = self.parse_batch_response(response, len(slides))
+            if texts is not None:
+                return texts
+            print(f"Malformed batch response for {len(slides)} slides, requesting them one by one")
+
+        return [self.request_ai(self.create_slide_prompt(*slide), job=job) for slide in slides]
+
+    def request_slide(self, slide_type, title, content, job=None):
+        """
+        Get the text of a slide. When the similarity cache is enabled and the prompt is not cached,
+        the text of a previous slide of the same type similar enough to this one is reused.
+        """
+        similar = (slide_type, title, content) if self.similarity_cache is not None else None
+        return self.request_ai(self.create_slide_prompt(slide_type, title, content), similar, job=job)
+
+    def request_ai(self, message, similar=None, role='expansion', job=None):
         """
         Get the response from the chosen AI model.
+        similar is the (slide_type, title, content) of a slide prompt, looked up in the similarity cache on a cache miss.
+        role selects the backends of the request: 'outline' or 'expansion' for slide texts and other short requests.
+        job is the JobContext of the request, its priority and fair share of the provider rate limits.
+        """
+        with tracer.span('llm_request', provider=self.provider, model=self.model, role=role) as span:
+            span.set('prompt_tokens', estimate_tokens(message))
+            cached_response = self._get_cached_response(message, role)
+            if not cached_response and similar is not None:
+                cached_response = self._get_similar_text(*similar)
+                span.set('similar', bool(cached_response))
+            span.set('cache_hit', bool(cached_response))
+            if cached_response:
+                return cached_response
+
+            response, coalesced = self.flights.do((role, message), self._request_backend, message, similar, role, job)
+            span.set('coalesced', coalesced)
+            span.set('response_tokens', estimate_tokens(response))
+            return response
+
+    def _request_backend(self, message, similar, role, job):
         """
-        cached_response = self._check_cache(message)
+        Send a request to the backend and cache its response.
+        The cache is checked again first, a request of the same prompt may have completed since the cache miss.
+        """
+        cached_response = self._get_cached_response(message, role)
         if cached_response:
             return cached_response
-        
-        if self.provider == 'openai':
-            response = self._get_openai_response(message)
-        elif self.provider == 'ollama':
-            response = self._get_ollama_response(message)
-        else:
-            raise ValueError("Unsupported provider")
-        
+
+        response = self.backend.complete(message, role, job)
+
         # Cache the response
-        self._update_cache(message, response)
-        
+        self._cache_response(message, role, response)
+        if similar is not None:
+            self._set_similar_text(*similar, response)
+
         return response
 
-    def _get_openai_response(self, message):
+    def _similarity_scope(self, slide_type):
         """
-        Get the response from the OpenAI GPT-3 model.
+        Return the scope of the similar slides: the same backends and slide type.
         """
-        response = openai.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[{"role": "user", "content": message}]
-        )
-        return response.choices[0].message.content
+        return f"{self.backend.identity('expansion')}:{slide_type}"
+
+    def _get_similar_text(self, slide_type, title, content):
+        """
+        Return the text of a previous slide similar to this one, or None.
+        """
+        similar = self.similarity_cache.get(self._similarity_scope(slide_type), f"{title}\n{content}")
+        if similar is None:
+            return None
+        print(f"Similar slide text reused for {title} (similarity {similar[1]:.2f})")
+        return similar[0]
+
+    def _set_similar_text(self, slide_type, title, content, text):
+        """
+        Store the text of a slide in the similarity cache.
+        """
+        self.similarity_cache.set(self._similarity_scope(slide_type), f"{title}\n{content}", text)
+
+    def stream_ai(self, message, role='expansion', job=None):
+        """
+        Get the response from the chosen AI model as a stream of text chunks.
+        A cached response is returned as a single chunk.
+        """
+        with tracer.span('llm_stream', provider=self.provider, model=self.model, role=role) as span:
+            span.set('prompt_tokens', estimate_tokens(message))
+            cached_response = self._get_cached_response(message, role)
+            span.set('cache_hit', bool(cached_response))
+            if cached_response:
+                yield cached_response
+                return
+
+            response = []
+            for chunk in self.backend.stream(message, role, job):
+                response.append(chunk)
+                yield chunk
+            response = ''.join(response)
+            span.set('response_tokens', estimate_tokens(response))
+
+            # Cache the response once it is complete
+            self._cache_response(message, role, response)
+
+    def cache_key(self, message, role):
+        """
+        Return the key of a response in both caches: the providers and models of the backends of the role,
+        and the message.
+        """
+        return self.backend.identity(role), message
+
+    def _get_cached_response(self, message, role):
+        """
+        Look the message up in the in-memory cache, then in the persistent cache.
+        """
+        key = self.cache_key(message, role)
+        if self.memory_cache is not None:
+            cached_response = self.memory_cache.get(key)
+            if cached_response:
+                return cached_response
+
+        cached_response = self._check_cache(key)
+        if cached_response and self.memory_cache is not None:
+            self.memory_cache.set(key, cached_response)
+        return cached_response
+
+    def _cache_response(self, message, role, response):
+        """
+        Store the response in the persistent and in-memory caches.
+        """
+        key = self.cache_key(message, role)
+        self._update_cache(key, response)
+        if self.memory_cache is not None:
+            self.memory_cache.set(key, response)
+
+    def cache_stats(self):
+        """
+        Return the counters of the in-memory cache, or None if it is disabled.
+        """
+        return self.memory_cache.stats() if self.memory_cache is not None else None
+
+    def backend_stats(self):
+        """
+        Return the requests, errors and latencies of each backend.
+        """
+        return self.backend.stats()
+
+    def scheduler_stats(self):
+        """
+        Return the waiting and running requests, and the wait times, of each backend.
+        """
+        return self.backend.scheduler.stats()
+
+    def flight_stats(self):
+        """
+        Return the number of backend requests and of identical concurrent requests coalesced into them.
+        """
+        return self.flights.stats()
 
-    def _get_ollama_response(self, message):
+    def similarity_stats(self):
         """
-        Get the response from the Ollama AI model.
+        Return the counters of the similarity cache, or None if it is disabled.
         """
-        headers = {"Authorization": f"Bearer {self.api_key}"}
-        data = {"prompt": message}
-        response = requests.post(f"{self.host}/api/completion", json=data, headers=headers)
-        response_json = response.json()
-        return response_json['response']
+        return self.similarity_cache.stats() if self.similarity_cache is not None else None
 
-    def _check_cache(self, message):
+    def _check_cache(self, key):
         """
-        Check if the message exists in the cache and return the cached response if it does.
+        Check if the key exists in the cache and return the cached response if it does.
         """
-        with open(self.cache_file, 'r') as f:
-            cache = json.load(f)
-        return cache.get(message)
+        return self.cache.get('\n'.join(key))
 
-    def _update_cache(self, message, response):
+    def _update_cache(self, key, response):
         """
         Update the cache with the new request-response pair.
         """
-        with open(self.cache_file, 'r') as f:
-            cache = json.load(f)
-        cache[message] = response
-        with open(self.cache_file, 'w') as f:
-            json.dump(cache, f, indent=4)
+        self.cache.set('\n'.join(key), response)
@@ -0,0 +1,192 @@
+# batch_runner.py
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import csv
+import json
+import os
+import re
+import time
+from core.scheduler import JobContext
+from core.slides_generator import SlidesGenerator
+
+# Generator of the worker process and its deck cache setting, set once by _init_worker
+_generator = None
+_use_deck_cache = True
+
+def read_topics(topics_file):
+    """
+    Read the decks to generate from a CSV file (with a header) or a JSONL file.
+    Each deck has a 'topic', a 'slides' count and an optional 'output' file name, named after
+    the topic and slide count by default. Raise ValueError, with its line number, for a deck
+    missing its topic or slide count, and when two decks have the same output file.
+    """
+    with open(topics_file, 'r', newline='') as f:
+        if topics_file.endswith('.jsonl'):
+            rows = [(line_number, _json_row(topics_file, line_number, line))
+                    for line_number, line in enumerate(f, 1) if line.strip()]
+        else:
+            reader = csv.DictReader(f)
+            rows = [(reader.line_num, row) for row in reader]
+
+    decks = []
+    outputs = {}
+    for line_number, row in rows:
+        missing = [key for key in ('topic', 'slides') if row.get(key) in (None, '')]
+        if missing:
+            raise ValueError(f"Line {line_number} of {topics_file} has no {' or '.join(missing)}")
+        topic = str(row['topic']).strip()
+        try:
+            slides = int(row['slides'])
+        except (TypeError, ValueError):
+            raise ValueError(f"Line {line_number} of {topics_file} has an invalid slide count: {row['slides']!r}")
+        output = row.get('output') or f"{slugify(topic)}_{slides}.pptx"
+        if output in outputs:
+            raise ValueError(f"Lines {outputs[output]} and {line_number} of {topics_file} are both written to {output}")
+        outputs[output] = line_number
+        decks.append({'topic': topic, 'slides': slides, 'output': output})
+    return decks
+
+def _json_row(topics_file, line_number, line):
+    """
+    Parse a line of a JSONL topics file, which must hold an object.
+    """
+    try:
+        row = json.loads(line)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Line {line_number} of {topics_file} is not valid JSON: {e}")
+    if not isinstance(row, dict):
+        raise ValueError(f"Line {line_number} of {topics_file} is not a JSON object")
+    return row
+
+def slugify(text):
+    """
+    Turn a topic into a file name.
+    """
+    return re.sub(r'[^A-Za-z0-9]+', '_', text).strip('_') or 'presentation'
+
+def _init_worker(config, use_deck_cache=True):
+    """
+    Create the generator of a worker process, it is reused for all the decks of the process.
+    """
+    global _generator, _use_deck_cache
+    _generator = SlidesGenerator(config)
+    _use_deck_cache = use_deck_cache
+
+def _run_deck(deck):
+    """
+    Generate a deck in a worker process and return its result.
+    """
+    start = time.time()
+    hits = _generator.deck_cache.hits if _generator.deck_cache is not None else 0
+    try:
+        _generator.generate_presentation(deck['topic'], deck['slides'], deck['output'],
+                                         job=JobContext(deck['output'], 'batch'), use_deck_cache=_use_deck_cache)
+        status, error = 'done', None
+    except Exception as e:
+        status, error = 'failed', f"{type(e).__name__}: {e}"
+    deck_cache_hit = _generator.deck_cache is not None and _generator.deck_cache.hits > hits
+    return dict(deck, status=status, error=error, seconds=time.time() - start, deck_cache_hit=deck_cache_hit)
+
+class BatchRunner:
+    def __init__(self, config, processes=4, force=False, use_deck_cache=True):
+        """
+        Initialize the runner generating decks in parallel worker processes.
+        The processes share the caches stored on disk: LLM responses, images, web searches and presentations.
+        Forced decks are generated again instead of being copied from the deck cache.
+        """
+        self.config = config
+        self.processes = max(1, processes)
+        self.force = force
+        self.use_deck_cache = use_deck_cache and not force
+        self.state_file = os.path.join(config['OUTPUT_PATH'], 'batch_state.json')
+
+    def run(self, topics_file, report_file=None):
+        """
+        Generate the decks listed in the topics file, skipping those that are up to date,
+        and write a JSON report of per-deck latencies and failures.
+        """
+        started = time.time()
+        decks = read_topics(topics_file)
+        state = self._load_state()
+        results = []
+
+        # The deck key covers topic, slide count, template, provider and model
+        generator = SlidesGenerator(self.config)
+        pending = []
+        for deck in decks:
+            deck['key'] = generator.deck_key(deck['topic'], deck['slides'])
+            output_file = os.path.join(self.config['OUTPUT_PATH'], deck['output'])
+            if not self.force and state.get(deck['output']) == deck['key'] and os.path.exists(output_file):
+                results.append(dict(deck, status='skipped', error=None, seconds=0.0, deck_cache_hit=False))
+            else:
+                pending.append(deck)
+
+        print(f"Generating {len(pending)} decks, {len(decks) - len(pending)} up to date")
+        # The processes share the provider rate limits
+        worker_config = dict(self.config, RATE_LIMIT_SHARES=self.processes)
+        with ProcessPoolExecutor(max_workers=self.processes, initializer=_init_worker,
+                                 initargs=(worker_config, self.use_deck_cache)) as executor:
+            futures = [executor.submit(_run_deck, deck) for deck in pending]
+            for future in as_completed(futures):
+                result = future.result()
+                results.append(result)
+                print(f"[{result['status']}] {result['topic']} ({result['seconds']:.1f}s)"
+                      + (f": {result['error']}" if result['error'] else ''))
+                if result['status'] == 'done':
+                    state[result['output']] = result['key']
+                    self._save_state(state)
+
+        report = self._report(results, time.time() - started)
+        report_file = report_file or os.path.join(self.config['OUTPUT_PATH'], 'batch_report.json')
+        with open(report_file, 'w') as f:
+            json.dump(report, f, indent=4)
+        return report
+
+    def _report(self, results, wall_seconds):
+        """
+        Summarize the results of the batch.
+        """
+        latencies = sorted(result['seconds'] for result in results if result['status'] == 'done')
+
+        def percentile(p):
+            return latencies[min(len(latencies) - 1, int(p * len(latencies)))] if latencies else None
+
+        counts = {}
+        for result in results:
+            counts[result['status']] = counts.get(result['status'], 0) + 1
+        deck_cache_hits = sum(1 for result in results if result['status'] == 'done' and result['deck_cache_hit'])
+        return {
+            'summary': {
+                'decks': len(results),
+                'done': counts.get('done', 0),
+                'skipped': counts.get('skipped', 0),
+                'failed': counts.get('failed', 0),
+                'deck_cache_hits': deck_cache_hits,
+                'deck_cache_hit_rate': deck_cache_hits / counts['done'] if counts.get('done') else 0.0,
+                'wall_seconds': wall_seconds,
+                'latency_p50': percentile(0.5),
+                'latency_p95': percentile(0.95),
+                'latency_max': latencies[-1] if latencies else None,
+            },
+            'decks': results,
+        }
+
+    def _load_state(self):
+        """
+        Load the keys of the decks generated by previous batches.
+        """
+        if os.path.exists(self.state_file):
+            try:
+                with open(self.state_file, 'r') as f:
+                    return json.load(f)
+            except json.JSONDecodeError:
+                print("Batch state file is corrupted, regenerating all decks.")
+        return {}
+
+    def _save_state(self, state):
+        """
+        Save the keys of the generated decks.
+        """
+        temp_file = self.state_file + '.tmp'
+        with open(temp_file, 'w') as f:
+            json.dump(state, f)
+        os.replace(temp_file, self.state_file)
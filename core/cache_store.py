@@ -0,0 +1,207 @@
+# cache_store.py
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# Windows of the last access of the entries reported by stats(), in seconds
+ACCESS_WINDOWS = (('1h', 3600), ('1d', 86400), ('7d', 7 * 86400), ('30d', 30 * 86400))
+
+class CacheStore:
+    # Number of writes between two eviction passes
+    EVICT_INTERVAL = 256
+    # Seconds between two updates of the last access time of an entry, most hits do not write
+    ACCESS_INTERVAL = 60
+
+    def __init__(self, db_file, max_bytes=0, max_age=0):
+        """
+        Initialize a key/value cache stored in a sqlite database.
+        Entries are indexed by the SHA-256 of their key, max_bytes and max_age (in seconds)
+        bound the size of the cache, 0 disables the limit.
+        """
+        self.db_file = db_file
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._local = threading.local()
+        self._writes = 0
+
+        os.makedirs(os.path.dirname(db_file) or '.', exist_ok=True)
+        conn = self._connection()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                key_hash TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )""")
+        conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed_at ON entries (accessed_at)")
+        self.evict()
+
+    def _connection(self):
+        """
+        Return the sqlite connection of the current thread, sqlite connections can not be shared.
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # Autocommit mode, the busy timeout lets several processes share the database
+            conn = sqlite3.connect(self.db_file, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def hash_key(key):
+        """
+        Hash a cache key.
+        """
+        return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """
+        Return the value cached for the key, or None if it is missing or expired.
+        The last access time is only updated when it is older than ACCESS_INTERVAL.
+        """
+        key_hash = self.hash_key(key)
+        conn = self._connection()
+        row = conn.execute("SELECT value, created_at, accessed_at FROM entries WHERE key_hash = ?",
+                           (key_hash,)).fetchone()
+        if row is None:
+            return None
+
+        value, created_at, accessed_at = row
+        now = time.time()
+        if self.max_age and created_at < now - self.max_age:
+            conn.execute("DELETE FROM entries WHERE key_hash = ?", (key_hash,))
+            return None
+
+        if accessed_at < now - self.ACCESS_INTERVAL:
+            conn.execute("UPDATE entries SET accessed_at = ? WHERE key_hash = ?", (now, key_hash))
+        return value
+
+    def set(self, key, value):
+        """
+        Store the value for the key, replacing any previous value.
+        """
+        now = time.time()
+        self._connection().execute(
+            "INSERT OR REPLACE INTO entries (key_hash, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+            (self.hash_key(key), value, len(value.encode('utf-8')), now, now))
+
+        self._writes += 1
+        if self._writes % self.EVICT_INTERVAL == 0:
+            self.evict()
+
+    def evict(self, max_bytes=None, max_age=None, min_idle=0, dry_run=False):
+        """
+        Remove the expired entries, then the least recently used ones until the cache fits in max_bytes.
+        The limits default to those of the cache. Entries accessed in the last min_idle seconds are kept,
+        they may be in use. Return the number of removed entries, or of entries to remove on a dry run.
+        """
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        max_age = self.max_age if max_age is None else max_age
+        conn = self._connection()
+        idle_before = time.time() - min_idle
+        stale = {}
+
+        if max_age:
+            stale.update(conn.execute("SELECT key_hash, size FROM entries WHERE created_at < ? AND accessed_at < ?",
+                                      (time.time() - max_age, idle_before)))
+
+        if max_bytes:
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            excess = total - sum(stale.values()) - max_bytes
+            for key_hash, size in conn.execute("SELECT key_hash, size FROM entries WHERE accessed_at < ? "
+                                               "ORDER BY accessed_at", (idle_before,)):
+                if excess <= 0:
+                    break
+                if key_hash not in stale:
+                    stale[key_hash] = size
+                    excess -= size
+
+        if not dry_run:
+            conn.executemany("DELETE FROM entries WHERE key_hash = ?", [(key_hash,) for key_hash in stale])
+        return len(stale)
+
+    def entries(self):
+        """
+        Return the (key_hash, value, size, created_at, accessed_at) of the entries, least recently used first.
+        """
+        return self._connection().execute(
+            "SELECT key_hash, value, size, created_at, accessed_at FROM entries ORDER BY accessed_at").fetchall()
+
+    def delete(self, key_hashes):
+        """
+        Remove the entries of the given key hashes.
+        """
+        self._connection().executemany("DELETE FROM entries WHERE key_hash = ?", [(key_hash,) for key_hash in key_hashes])
+
+    def replace_value(self, old_value, new_value):
+        """
+        Replace a value in all the entries holding it, return the number of updated entries.
+        """
+        return self._connection().execute("UPDATE entries SET value = ?, size = ? WHERE value = ?",
+                                          (new_value, len(new_value.encode('utf-8')), old_value)).rowcount
+
+    def stats(self):
+        """
+        Return the number of entries, their size, the size of the database files, the age of the oldest entry,
+        the number of entries hit at least once and the number of entries accessed within each window.
+        Access times are recorded every ACCESS_INTERVAL, hits within that interval of the store are not counted.
+        """
+        now = time.time()
+        windows = ', '.join(f"COALESCE(SUM(accessed_at >= {now - seconds}), 0)" for _, seconds in ACCESS_WINDOWS)
+        row = self._connection().execute(
+            f"SELECT COUNT(*), COALESCE(SUM(size), 0), MIN(created_at), COALESCE(SUM(accessed_at > created_at), 0), "
+            f"{windows} FROM entries").fetchone()
+        entries, size, oldest, hit = row[:4]
+        return {
+            'entries': entries,
+            'bytes': size,
+            'file_bytes': sum(os.path.getsize(self.db_file + suffix) for suffix in ('', '-wal', '-shm')
+                              if os.path.exists(self.db_file + suffix)),
+            'oldest_age_seconds': round(now - oldest) if oldest else None,
+            'hit_entries': hit,
+            'accessed_within': {label: count for (label, _), count in zip(ACCESS_WINDOWS, row[4:])},
+        }
+
+    def migrate_json(self, json_file, key=None):
+        """
+        Import the entries of a legacy JSON cache file, the file is renamed once imported.
+        key maps a legacy key to its key in this cache.
+        """
+        if not os.path.exists(json_file):
+            return 0
+
+        try:
+            with open(json_file, 'r') as f:
+                legacy = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"Could not migrate cache file {json_file}: {e}")
+            return 0
+
+        now = time.time()
+        rows = [
+            (self.hash_key(key(legacy_key) if key else legacy_key), value, len(value.encode('utf-8')), now, now)
+            for legacy_key, value in legacy.items() if isinstance(value, str)
+        ]
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT OR IGNORE INTO entries (key_hash, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                rows)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+        try:
+            os.replace(json_file, json_file + '.migrated')
+        except FileNotFoundError:
+            pass  # Already migrated by another process
+        print(f"Migrated {len(rows)} entries from {json_file} to {self.db_file}")
+        return len(rows)
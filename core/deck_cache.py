@@ -0,0 +1,82 @@
+# deck_cache.py
+import json
+import os
+import shutil
+import threading
+from core.cache_store import CacheStore
+from core.deck_manifest import manifest_path
+from core.file_utils import create_temp_file
+
+class DeckCache:
+    def __init__(self, cache_path, ttl=86400):
+        """
+        Initialize the cache of finished presentations, by deck key: the key of the topic, slide count,
+        template, provider and model. Each entry holds a copy of the file and of its manifest,
+        stored in cache_path and indexed in cache_path/index.db. Entries expire after ttl seconds, 0 keeps them.
+        """
+        self.cache_path = cache_path
+        self.index = CacheStore(os.path.join(cache_path, 'index.db'), max_age=ttl)
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.hits = 0
+
+    def get(self, deck_key, output_path, filename=None):
+        """
+        Copy the cached presentation of the deck key and its manifest to output_path, under filename
+        or under the name of the cached file, and return the file name, or None on a miss.
+        """
+        entry = self.index.get(deck_key)
+        artifact = json.loads(entry) if entry else None
+        if artifact is not None and not os.path.exists(os.path.join(self.cache_path, artifact['file'])):
+            # The file was removed by the maintenance
+            artifact = None
+        with self._lock:
+            self.lookups += 1
+            if artifact is not None:
+                self.hits += 1
+        if artifact is None:
+            return None
+
+        ppt_filename = filename or artifact['filename']
+        output_file = os.path.join(output_path, ppt_filename)
+        self._copy(os.path.join(self.cache_path, artifact['file']), output_file)
+        if artifact.get('manifest'):
+            self._copy(os.path.join(self.cache_path, artifact['manifest']), manifest_path(output_file))
+        return ppt_filename
+
+    def set(self, deck_key, output_path, ppt_filename):
+        """
+        Store a copy of a generated presentation and of its manifest for the deck key.
+        """
+        output_file = os.path.join(output_path, ppt_filename)
+        artifact = {'file': f"{deck_key}.pptx", 'filename': ppt_filename, 'manifest': None}
+        self._copy(output_file, os.path.join(self.cache_path, artifact['file']))
+        if os.path.exists(manifest_path(output_file)):
+            artifact['manifest'] = f"{deck_key}.manifest.json"
+            self._copy(manifest_path(output_file), os.path.join(self.cache_path, artifact['manifest']))
+        self.index.set(deck_key, json.dumps(artifact))
+
+    def stats(self):
+        """
+        Return the number of lookups and hits, and the hit rate.
+        """
+        with self._lock:
+            return {
+                'lookups': self.lookups,
+                'hits': self.hits,
+                'hit_rate': self.hits / self.lookups if self.lookups else 0.0,
+            }
+
+    def _copy(self, source, target):
+        """
+        Copy a file next to its target then move it, readers never see a partial file.
+        """
+        os.makedirs(os.path.dirname(target) or '.', exist_ok=True)
+        fd, temp_path = create_temp_file(os.path.dirname(target) or '.')
+        os.close(fd)
+        try:
+            shutil.copyfile(source, temp_path)
+            os.replace(temp_path, target)
+        except BaseException:
+            os.remove(temp_path)
+            raise
@@ -0,0 +1,126 @@
+# deck_manifest.py
+import hashlib
+import json
+import os
+import time
+from core.file_utils import create_temp_file
+
+MANIFEST_VERSION = 1
+# Fields of a slide spec holding generated content, saved as the slide outputs
+OUTPUT_FIELDS = ('subtitle', 'content', 'content_left', 'content_right', 'image')
+
+def digest(value):
+    """
+    Return the sha256 hash of a JSON serializable value.
+    """
+    return hashlib.sha256(json.dumps(value, sort_keys=True).encode('utf-8')).hexdigest()
+
+def manifest_path(output_file):
+    """
+    Return the path of the manifest saved next to a presentation, e.g. 'output/Deck.manifest.json'.
+    """
+    return os.path.splitext(output_file)[0] + '.manifest.json'
+
+class DeckManifest:
+    def __init__(self, path):
+        """
+        Initialize the manifest of a presentation: the input hashes and the generated outputs of each slide.
+        """
+        self.path = path
+        self.data = None
+
+    def load(self):
+        """
+        Read the manifest, return False when it is missing, corrupted or of another version.
+        """
+        if not os.path.exists(self.path):
+            return False
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            print(f"Manifest {self.path} is corrupted, ignoring it.")
+            return False
+        if data.get('version') != MANIFEST_VERSION:
+            return False
+        self.data = data
+        return True
+
+    def slide_outputs(self):
+        """
+        Return the outputs of the slides of the loaded manifest, by slide input key.
+        Slides whose image file no longer exists are left out.
+        """
+        if self.data is None:
+            return {}
+        outputs = {}
+        for slide in self.data.get('slides', []):
+            image = slide['outputs'].get('image')
+            if image and not os.path.exists(image):
+                continue
+            outputs[slide['key']] = slide['outputs']
+        return outputs
+
+    def save(self, deck_key, topic, slide_length, template, slides):
+        """
+        Write the manifest of a generated presentation. It is written to a temporary file of its own
+        then moved, concurrent saves of the same manifest do not share a temporary file.
+        """
+        self.data = {
+            'version': MANIFEST_VERSION,
+            'deck_key': deck_key,
+            'topic': topic,
+            'slide_length': slide_length,
+            'template': template,
+            'generated_at': time.time(),
+            'slides': slides,
+        }
+        fd, temp_path = create_temp_file(os.path.dirname(self.path) or '.', suffix='.json')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(self.data, f, indent=4)
+        os.replace(temp_path, self.path)
+
+class DeckCheckpoint:
+    def __init__(self, path):
+        """
+        Initialize the checkpoint of a presentation being generated: the manifest entries of its
+        completed slides, appended one JSON line per slide so an interrupted generation can be resumed.
+        """
+        self.path = path
+
+    def load(self):
+        """
+        Return the outputs of the checkpointed slides, by slide input key.
+        A line cut by an interruption is ignored, as are slides whose image file no longer exists.
+        """
+        if not os.path.exists(self.path):
+            return {}
+        outputs = {}
+        with open(self.path, 'r') as f:
+            for line in f:
+                try:
+                    slide = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                image = slide['outputs'].get('image')
+                if image and not os.path.exists(image):
+                    continue
+                outputs[slide['key']] = slide['outputs']
+        return outputs
+
+    def append(self, slide):
+        """
+        Add the manifest entry of a completed slide, written to disk before the next slide.
+        """
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(slide) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def remove(self):
+        """
+        Delete the checkpoint once the presentation is saved.
+        """
+        if os.path.exists(self.path):
+            os.remove(self.path)
@@ -0,0 +1,281 @@
+# deck_service.py
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import queue
+import threading
+import time
+import uuid
+from core.scheduler import JobContext, PRIORITIES
+from core.tracing import METRIC_PREFIX, tracer
+
+class DeckService:
+    # Number of finished jobs kept for status requests
+    JOB_HISTORY = 1000
+
+    def __init__(self, generator, workers=2, queue_size=16):
+        """
+        Initialize the service running presentation jobs on a pool of worker threads.
+        The generator, its template and its caches stay loaded between jobs.
+        """
+        self.generator = generator
+        self.jobs = {}
+        self._finished = []
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._maintenance = None
+        self._maintenance_lock = threading.Lock()
+        self._workers = [threading.Thread(target=self._work, daemon=True) for _ in range(max(1, workers))]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, topic, slide_length, priority='interactive', use_deck_cache=True):
+        """
+        Queue a presentation job and return it, raise queue.Full if the queue is full.
+        The priority of its LLM requests is 'interactive' or 'batch'. Without use_deck_cache,
+        the presentation is generated again even if the deck cache holds it.
+        """
+        job = {
+            'id': uuid.uuid4().hex,
+            'topic': topic,
+            'slides': slide_length,
+            'priority': priority,
+            'deck_cache': use_deck_cache,
+            'status': 'queued',
+            'queued_at': time.time(),
+        }
+        with self._lock:
+            self._queue.put_nowait(job)
+            self.jobs[job['id']] = job
+        return dict(job)
+
+    def get(self, job_id):
+        """
+        Return a copy of the job, or None if it is unknown.
+        """
+        with self._lock:
+            job = self.jobs.get(job_id)
+            return dict(job) if job else None
+
+    def list(self):
+        """
+        Return a copy of all the known jobs.
+        """
+        with self._lock:
+            return [dict(job) for job in self.jobs.values()]
+
+    def stats(self):
+        """
+        Return the queue depth and the number of jobs in each status.
+        """
+        with self._lock:
+            statuses = {}
+            for job in self.jobs.values():
+                statuses[job['status']] = statuses.get(job['status'], 0) + 1
+        return {
+            'queue_depth': self._queue.qsize(),
+            'workers': len(self._workers),
+            'jobs': statuses,
+            'llm_memory_cache': self.generator.ai_requester.cache_stats(),
+            'similarity_cache': self.generator.ai_requester.similarity_stats(),
+            'deck_cache': self.generator.deck_cache_stats(),
+            'backends': self.generator.ai_requester.backend_stats(),
+            'scheduler': self.generator.ai_requester.scheduler_stats(),
+            'single_flight': {
+                'llm': self.generator.ai_requester.flight_stats(),
+                'images': self.generator.image_searcher.flight_stats(),
+            },
+        }
+
+    def storage(self):
+        """
+        Return the entries, sizes and access ages of the caches and the size of the image folders.
+        """
+        with self._maintenance_lock:
+            return self._store_maintenance().stats()
+
+    def maintain(self, dry_run=False, compact=False):
+        """
+        Evict the caches and remove the unused image files while jobs keep running.
+        Compacting the cache databases blocks the running jobs until it is done.
+        """
+        with self._maintenance_lock:
+            return self._store_maintenance().run(dry_run=dry_run, compact=compact)
+
+    def _store_maintenance(self):
+        """
+        Return the maintenance of the stores of the generator, created on first use.
+        """
+        if self._maintenance is None:
+            from core.maintenance import StoreMaintenance
+            self._maintenance = StoreMaintenance(self.generator.config)
+        return self._maintenance
+
+    def metrics(self):
+        """
+        Return the pipeline metrics and the queue gauges in the Prometheus text format.
+        """
+        stats = self.stats()
+        lines = [f"# TYPE {METRIC_PREFIX}_queue_depth gauge", f"{METRIC_PREFIX}_queue_depth {stats['queue_depth']}",
+                 f"# TYPE {METRIC_PREFIX}_jobs gauge"]
+        for status, count in sorted(stats['jobs'].items()):
+            lines.append(f'{METRIC_PREFIX}_jobs{{status="{status}"}} {count}')
+
+        # Outbound LLM requests waiting for their backend, and their wait times
+        lines.append(f"# TYPE {METRIC_PREFIX}_llm_queue_depth gauge")
+        for backend, queue_stats in sorted(stats['scheduler'].items()):
+            for priority_class, waiting in sorted(queue_stats['waiting_by_class'].items()):
+                lines.append(f'{METRIC_PREFIX}_llm_queue_depth{{backend="{backend}",class="{priority_class}"}} {waiting}')
+        lines.append(f"# TYPE {METRIC_PREFIX}_llm_queue_wait_seconds summary")
+        for backend, queue_stats in sorted(stats['scheduler'].items()):
+            lines.append(f'{METRIC_PREFIX}_llm_queue_wait_seconds_sum{{backend="{backend}"}} {queue_stats["wait_seconds_sum"]}')
+            lines.append(f'{METRIC_PREFIX}_llm_queue_wait_seconds_count{{backend="{backend}"}} {queue_stats["granted"]}')
+        return tracer.prometheus() + "\n".join(lines) + "\n"
+
+    def _work(self):
+        """
+        Run the queued jobs until the process exits.
+        """
+        while True:
+            job = self._queue.get()
+            with self._lock:
+                job['status'] = 'running'
+                job['started_at'] = time.time()
+                job['wait_seconds'] = job['started_at'] - job['queued_at']
+
+            try:
+                # Each job has its own file, concurrent jobs of the same title do not overwrite each other
+                ppt_file = self.generator.generate_presentation(job['topic'], job['slides'], f"{job['id']}.pptx",
+                                                                job=JobContext(job['id'], job['priority']),
+                                                                use_deck_cache=job['deck_cache'])
+                result = {'status': 'done', 'file': ppt_file}
+            except Exception as e:
+                print(f"Job {job['id']} failed: {e}")
+                result = {'status': 'failed', 'error': str(e)}
+
+            with self._lock:
+                job.update(result)
+                job['finished_at'] = time.time()
+                job['run_seconds'] = job['finished_at'] - job['started_at']
+                self._forget_old_jobs(job['id'])
+            self._queue.task_done()
+
+    def _forget_old_jobs(self, job_id):
+        """
+        Drop the oldest finished jobs beyond JOB_HISTORY, the lock must be held.
+        """
+        self._finished.append(job_id)
+        while len(self._finished) > self.JOB_HISTORY:
+            self.jobs.pop(self._finished.pop(0), None)
+
+class DeckRequestHandler(BaseHTTPRequestHandler):
+    """
+    HTTP API of the service:
+    POST /jobs {"topic": ..., "slides": ...} queues a job written to OUTPUT_PATH/<id>.pptx,
+    GET /jobs/<id> returns its status, GET /jobs lists the jobs and GET /health returns the service statistics.
+    A job with "deck_cache": false is generated again even if the deck cache holds its presentation.
+    GET /metrics returns the Prometheus metrics and GET /trace the Chrome trace of the recorded spans, when TRACING is enabled.
+    GET /storage returns the cache usage and POST /maintenance {"dry_run": false, "compact": false} evicts the caches
+    and removes the unused image files, "compact": true also rebuilds the cache databases and blocks the running jobs.
+    """
+    service = None
+
+    def do_POST(self):
+        """
+        Queue a presentation job, or run the maintenance of the stores.
+        """
+        if self.path == '/maintenance':
+            try:
+                request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+                dry_run = request.get('dry_run', False)
+                compact = request.get('compact', False)
+                if not isinstance(dry_run, bool) or not isinstance(compact, bool):
+                    raise ValueError(dry_run, compact)
+            except (ValueError, AttributeError):
+                self._send_json(400, {'error': 'Expected a JSON body with optional "dry_run" and "compact" (true or false)'})
+                return
+            self._send_json(200, self.service.maintain(dry_run, compact))
+            return
+        if self.path != '/jobs':
+            self._send_json(404, {'error': 'Not found'})
+            return
+
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            topic = str(request['topic'])
+            slide_length = int(request['slides'])
+            priority = request.get('priority', 'interactive')
+            if priority not in PRIORITIES:
+                raise ValueError(priority)
+            use_deck_cache = request.get('deck_cache', True)
+            if not isinstance(use_deck_cache, bool):
+                raise ValueError(use_deck_cache)
+        except (ValueError, KeyError, TypeError):
+            self._send_json(400, {'error': 'Expected a JSON body with "topic", "slides", an optional "priority" '
+                                           '("interactive" or "batch") and an optional "deck_cache" (true or false)'})
+            return
+
+        try:
+            job = self.service.submit(topic, slide_length, priority, use_deck_cache)
+        except queue.Full:
+            self._send_json(503, {'error': 'Job queue is full'})
+            return
+        self._send_json(202, job)
+
+    def do_GET(self):
+        """
+        Return the service statistics, the metrics, the trace, the job list or the status of a job.
+        """
+        if self.path == '/health':
+            self._send_json(200, self.service.stats())
+        elif self.path == '/metrics':
+            self._send_text(200, self.service.metrics())
+        elif self.path == '/storage':
+            self._send_json(200, self.service.storage())
+        elif self.path == '/trace':
+            self._send_json(200, tracer.chrome_trace())
+        elif self.path == '/jobs':
+            self._send_json(200, self.service.list())
+        elif self.path.startswith('/jobs/'):
+            job = self.service.get(self.path[len('/jobs/'):])
+            if job:
+                self._send_json(200, job)
+            else:
+                self._send_json(404, {'error': 'Unknown job'})
+        else:
+            self._send_json(404, {'error': 'Not found'})
+
+    def _send_json(self, status, data):
+        """
+        Send a JSON response.
+        """
+        self._send_body(status, json.dumps(data, default=str).encode('utf-8'), 'application/json')
+
+    def _send_text(self, status, text):
+        """
+        Send a response in the Prometheus text format.
+        """
+        self._send_body(status, text.encode('utf-8'), 'text/plain; version=0.0.4')
+
+    def _send_body(self, status, body, content_type):
+        """
+        Send a response body.
+        """
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+def serve(generator, host, port, workers=2, queue_size=16):
+    """
+    Run the presentation service on the given address until interrupted.
+    """
+    handler = type('BoundDeckRequestHandler', (DeckRequestHandler,), {'service': DeckService(generator, workers, queue_size)})
+    server = ThreadingHTTPServer((host, port), handler)
+    print(f"Serving presentations on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
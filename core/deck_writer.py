@@ -0,0 +1,117 @@
+# deck_writer.py
+import hashlib
+import io
+import os
+import shutil
+import zipfile
+
+# Image formats replaced by a stub until the package is written
+STUB_FORMATS = ('JPEG', 'PNG')
+# Members larger than this need zip64 headers
+ZIP64_LIMIT = (1 << 31) - 1
+
+def package_internals():
+    """
+    Return the python-pptx internals writing the package parts, or None when this python-pptx version lacks them.
+    """
+    try:
+        from pptx.opc.oxml import serialize_part_xml
+        from pptx.opc.package import OpcPackage
+        from pptx.opc.packuri import CONTENT_TYPES_URI, PACKAGE_URI
+        from pptx.opc.serialized import _ContentTypesItem
+    except ImportError:
+        return None
+    if not hasattr(OpcPackage, '_rels') or not hasattr(_ContentTypesItem, 'xml_for'):
+        return None
+    return serialize_part_xml, CONTENT_TYPES_URI, PACKAGE_URI, _ContentTypesItem
+
+class DeckWriter:
+    def __init__(self, chunk_size=1 << 20):
+        """
+        Initialize the writer of a large presentation. The slides hold small stub images
+        with the dimensions of the real ones, the real images stay on disk until the package is written.
+        Without the python-pptx internals this relies on, images are inserted as is and the presentation
+        is saved by python-pptx.
+        """
+        self.chunk_size = chunk_size
+        # Image files by sha1 of their stub
+        self.images = {}
+        self.internals = package_internals()
+        if self.internals is None:
+            print("This python-pptx version can not stream the images, they are kept in memory.")
+
+    def image_stub(self, image_path):
+        """
+        Return a stub of an image to insert in a slide in its place, or the image path for unsupported formats.
+        The stub has the format, pixel size and resolution of the image, so the slide is laid out
+        and cropped as with the real image. Stubs of identical images are identical and share their part.
+        """
+        if self.internals is None:
+            return image_path
+        from PIL import Image
+
+        with Image.open(image_path) as image:
+            image_format, size, dpi = image.format, image.size, image.info.get('dpi')
+        if image_format not in STUB_FORMATS:
+            return image_path
+
+        marker = f"slides-ai:{self._file_digest(image_path)}"
+        stub = io.BytesIO()
+        options = {'dpi': tuple(round(value) for value in dpi)} if dpi else {}
+        if image_format == 'JPEG':
+            Image.new('L', size).save(stub, 'JPEG', comment=marker.encode('ascii'), **options)
+        else:
+            from PIL.PngImagePlugin import PngInfo
+            info = PngInfo()
+            info.add_text('Source', marker)
+            Image.new('1', size).save(stub, 'PNG', pnginfo=info, **options)
+
+        self.images[hashlib.sha1(stub.getvalue()).hexdigest()] = image_path
+        stub.seek(0)
+        return stub
+
+    def save(self, presentation, path):
+        """
+        Write the presentation package, streaming the real images from disk in place of their stubs.
+        The file is written next to its destination then moved, an interrupted save leaves no partial file.
+        """
+        temp_path = path + '.tmp'
+        if self.internals is None:
+            presentation.save(temp_path)
+            os.replace(temp_path, path)
+            return
+
+        serialize_part_xml, CONTENT_TYPES_URI, PACKAGE_URI, _ContentTypesItem = self.internals
+        package = presentation.part.package
+        parts = tuple(package.iter_parts())
+        with zipfile.ZipFile(temp_path, 'w', zipfile.ZIP_DEFLATED, strict_timestamps=False) as package_file:
+            package_file.writestr(CONTENT_TYPES_URI.membername, serialize_part_xml(_ContentTypesItem.xml_for(parts)))
+            package_file.writestr(PACKAGE_URI.rels_uri.membername, package._rels.xml)
+            for part in parts:
+                image_path = self.images.get(part.sha1) if hasattr(part, 'sha1') else None
+                if image_path is not None:
+                    self._write_file(package_file, part.partname.membername, image_path)
+                else:
+                    package_file.writestr(part.partname.membername, part.blob)
+                if len(part.rels):
+                    package_file.writestr(part.partname.rels_uri.membername, part.rels.xml)
+        os.replace(temp_path, path)
+
+    def _write_file(self, package_file, name, file_path):
+        """
+        Copy a file into the package by chunks. Images are already compressed, they are stored as is.
+        """
+        info = zipfile.ZipInfo.from_file(file_path, name, strict_timestamps=False)
+        info.compress_type = zipfile.ZIP_STORED
+        with open(file_path, 'rb') as source, package_file.open(info, 'w', force_zip64=info.file_size > ZIP64_LIMIT) as target:
+            shutil.copyfileobj(source, target, self.chunk_size)
+
+    def _file_digest(self, file_path):
+        """
+        Return the sha256 hash of a file, read by chunks.
+        """
+        file_hash = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(self.chunk_size), b''):
+                file_hash.update(chunk)
+        return file_hash.hexdigest()
@@ -0,0 +1,16 @@
+# file_utils.py
+import os
+import tempfile
+
+# The umask can only be read by setting it, it is read once when the module is imported
+UMASK = os.umask(0)
+os.umask(UMASK)
+
+def create_temp_file(directory, suffix=''):
+    """
+    Create a temporary file in directory to be moved over its target once written, and return its (fd, path).
+    The file gets the permissions of a regular new file, mkstemp creates it readable by its owner only.
+    """
+    fd, temp_path = tempfile.mkstemp(prefix='.tmp_', suffix=suffix, dir=directory)
+    os.chmod(temp_path, 0o666 & ~UMASK)
+    return fd, temp_path
@@ -0,0 +1,101 @@
+# image_processor.py
+import hashlib
+import os
+import threading
+from core.file_utils import create_temp_file
+from core.tracing import tracer
+
+EMU_PER_INCH = 914400
+
+class ImageProcessor:
+    def __init__(self, config):
+        """
+        Initialize the processor resizing and recompressing the images before they are inserted in a slide.
+        Processed variants are cached in IMAGES_PATH/processed by source hash and target size.
+        """
+        self.enabled = config.get('IMAGE_PROCESSING', True)
+        self.dpi = config.get('IMAGE_DPI', 150)
+        self.quality = config.get('IMAGE_QUALITY', 85)
+        self.variants_path = os.path.join(config.get('IMAGES_PATH', 'images'), 'processed')
+        self._lock = threading.Lock()
+        os.makedirs(self.variants_path, exist_ok=True)
+
+    def prepare(self, image_path, width, height, stats=None):
+        """
+        Return the path of a variant of the image no larger than needed to fill a placeholder
+        of the given size in EMU, as a JPEG (or PNG for transparent images) without metadata.
+        The original and processed sizes are added to the stats dict when given.
+        """
+        if not self.enabled:
+            return image_path
+
+        with tracer.span('image_processing', image=os.path.basename(image_path)) as span:
+            with open(image_path, 'rb') as f:
+                source = f.read()
+            target = (max(1, round(width / EMU_PER_INCH * self.dpi)), max(1, round(height / EMU_PER_INCH * self.dpi)))
+            variant_name = f"{hashlib.sha256(source).hexdigest()[:32]}_{target[0]}x{target[1]}"
+
+            variant_path = self._find_variant(variant_name)
+            span.set('cache_hit', variant_path is not None)
+            if variant_path is None:
+                try:
+                    variant_path = self._process(image_path, variant_name, target)
+                except (OSError, ValueError) as e:
+                    print(f"Could not process image {image_path}: {e}")
+                    variant_path = image_path
+
+            # Keep the original when it is already smaller than the processed variant
+            processed_size = os.path.getsize(variant_path)
+            if processed_size >= len(source):
+                variant_path, processed_size = image_path, len(source)
+            span.set('original_bytes', len(source))
+            span.set('processed_bytes', processed_size)
+
+        if stats is not None:
+            with self._lock:
+                stats['images'] = stats.get('images', 0) + 1
+                stats['original_bytes'] = stats.get('original_bytes', 0) + len(source)
+                stats['processed_bytes'] = stats.get('processed_bytes', 0) + processed_size
+        return variant_path
+
+    def _find_variant(self, variant_name):
+        """
+        Return the path of a cached variant, or None.
+        """
+        for extension in ('jpg', 'png'):
+            variant_path = os.path.join(self.variants_path, f"{variant_name}.{extension}")
+            if os.path.exists(variant_path):
+                return variant_path
+        return None
+
+    def _process(self, image_path, variant_name, target):
+        """
+        Downscale the image so that it still covers the target size, then save it without metadata.
+        """
+        from PIL import Image, ImageOps
+
+        with Image.open(image_path) as image:
+            image.load()
+            # The orientation tag is dropped with the metadata, apply it to the pixels first
+            image = ImageOps.exif_transpose(image)
+            has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+
+            # The picture placeholder crops the image to its shape, it must cover both dimensions
+            scale = max(target[0] / image.width, target[1] / image.height)
+            if scale < 1:
+                image = image.resize((max(1, round(image.width * scale)), max(1, round(image.height * scale))),
+                                     Image.LANCZOS)
+
+            if has_alpha:
+                image, extension, options = image.convert('RGBA'), 'png', {'optimize': True}
+            else:
+                image, extension, options = image.convert('RGB'), 'jpg', {
+                    'quality': self.quality, 'optimize': True, 'progressive': True}
+
+            variant_path = os.path.join(self.variants_path, f"{variant_name}.{extension}")
+            fd, temp_path = create_temp_file(self.variants_path, suffix=f".{extension}")
+            with os.fdopen(fd, 'wb') as f:
+                # No exif or icc_profile argument, the metadata is dropped
+                image.save(f, 'PNG' if has_alpha else 'JPEG', **options)
+            os.replace(temp_path, variant_path)
+        return variant_path
@@ -1,84 +1,178 @@
+import atexit
 import os
-import json
-import random
-import string
-from icrawler import ImageDownloader
-from icrawler.builtin import GoogleImageCrawler, BingImageCrawler
-from urllib.parse import urlparse
-import base64
-
-
-
-class PrefixDownloader(ImageDownloader):
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        # generate unique name for each image using uuid and base64
-        self.unique_image_name = ''.join(random.choices(string.ascii_letters + string.digits, k=16))
-
-    def get_filename(self, task, default_ext):
-        url_path = urlparse(task['file_url'])[2]
-        if '.' in url_path:
-            extension = url_path.split('.')[-1]
-            if extension.lower() not in [
-                'jpg', 'jpeg', 'png', 'bmp', 'tiff', 'gif', 'ppm', 'pgm'
-            ]:
-                extension = default_ext
-        else:
-            extension = default_ext
-
-        filename = base64.b64encode(url_path.encode()).decode()
-        return "p_" + self.unique_image_name + '{}.{}'.format(filename, extension)
+import hashlib
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from core.cache_store import CacheStore
+from core.file_utils import create_temp_file
+from core.single_flight import SingleFlight
+from core.tracing import tracer
+
+IMAGE_EXTENSIONS = ['jpg', 'jpeg', 'png', 'bmp', 'tiff', 'gif', 'ppm', 'pgm']
+
+class BingImageFetcher:
+    def __init__(self, images_path):
+        """
+        Initialize the fetcher downloading the first Bing image result of a query.
+        Each download thread keeps its own crawler, with its HTTP session and its own temporary folder.
+        """
+        self.images_path = images_path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._crawl_dirs = []
+        atexit.register(self.close)
+
+    def _crawler(self):
+        """
+        Return the crawler of the current thread and its download folder, created on the first crawl.
+        """
+        crawler = getattr(self._local, 'crawler', None)
+        if crawler is None:
+            # icrawler is imported on the first crawl, image queries are often all cached
+            from icrawler.builtin import BingImageCrawler
+
+            crawl_dir = tempfile.mkdtemp(prefix='.crawl_', dir=self.images_path)
+            with self._lock:
+                self._crawl_dirs.append(crawl_dir)
+            crawler = BingImageCrawler(
+                feeder_threads=1,
+                parser_threads=1,
+                downloader_threads=1,
+                storage={'root_dir': crawl_dir})
+            self._local.crawler, self._local.crawl_dir = crawler, crawl_dir
+        return crawler, self._local.crawl_dir
+
+    def fetch(self, query):
+        """
+        Download the first image found for the query and return its (content, extension), or None.
+        Crawls of different threads download to different folders so concurrent crawls can not mix their files.
+        icrawler still starts its feeder, parser and downloader threads on each crawl.
+        """
+        crawler, crawl_dir = self._crawler()
+        # The folder may have been removed by the maintenance while the thread was idle
+        os.makedirs(crawl_dir, exist_ok=True)
+        self._clear(crawl_dir)
+        try:
+            crawler.crawl(keyword=query, max_num=1)
+
+            for image_file in sorted(os.listdir(crawl_dir)):
+                extension = image_file.rsplit('.', 1)[-1].lower() if '.' in image_file else 'jpg'
+                with open(os.path.join(crawl_dir, image_file), 'rb') as f:
+                    return f.read(), extension if extension in IMAGE_EXTENSIONS else 'jpg'
+            return None
+        finally:
+            self._clear(crawl_dir)
+
+    def close(self):
+        """
+        Remove the download folders of the crawlers.
+        """
+        with self._lock:
+            crawl_dirs, self._crawl_dirs = self._crawl_dirs, []
+        for crawl_dir in crawl_dirs:
+            shutil.rmtree(crawl_dir, ignore_errors=True)
+
+    @staticmethod
+    def _clear(crawl_dir):
+        """
+        Remove the files left in a download folder by the previous crawl.
+        """
+        for name in os.listdir(crawl_dir) if os.path.isdir(crawl_dir) else []:
+            path = os.path.join(crawl_dir, name)
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
 
 class ImageSearcher:
-    def __init__(self, config):
+    def __init__(self, config, fetcher=None):
+        """
+        Initialize the image searcher with its query index and its pool of download threads.
+        The fetcher downloads the image of a query, Bing is used by default.
+        """
         self.images_path = config.get('IMAGES_PATH', 'images')
-        self.cache_file = os.path.join(self.images_path, config.get('CACHE_FILE', 'cache.json'))
-        self.cache = self.load_cache()
-
-    def load_cache(self):
-        """Load cache from a JSON file."""
-        if os.path.exists(self.cache_file):
-            try:
-                with open(self.cache_file, 'r') as f:
-                    return json.load(f)
-            except json.JSONDecodeError:
-                print("Cache file is corrupted, starting with an empty cache.")
-        return {}
-
-    def save_cache(self):
-        """Save cache to a JSON file."""
-        with open(self.cache_file, 'w') as f:
-            json.dump(self.cache, f)
+        self.fetcher = fetcher or BingImageFetcher(self.images_path)
+        self.index = CacheStore(os.path.join(self.images_path, 'index.db'))
+        self.executor = ThreadPoolExecutor(max_workers=max(1, config.get('IMAGE_WORKERS', 4)),
+                                           thread_name_prefix='image')
+        # Concurrent downloads of the same query share a single download
+        self.flights = SingleFlight()
+
+        # Import the queries cached by previous versions
+        self.index.migrate_json(os.path.join(self.images_path, config.get('CACHE_FILE', 'cache.json')))
+
+    def submit(self, query):
+        """
+        Download the image of the query on the download threads and return its future.
+        """
+        return self.executor.submit(self.download_image, query)
+
+    def download_images(self, queries):
+        """
+        Download the images of several queries concurrently and return their file names in order.
+        """
+        return [future.result() for future in [self.submit(query) for query in queries]]
 
     def download_image(self, query):
-        # Check if the query result is already cached
-        if query in self.cache:
-            print(f"Cache hit for query: {query}")
-            return self.cache[query]
-
-        # If not cached, download the image
-        google_crawler = BingImageCrawler(
-            downloader_cls=PrefixDownloader,
-            feeder_threads=1,
-            parser_threads=2,
-            downloader_threads=4,
-            storage={'root_dir': self.images_path})
-        google_crawler.crawl(keyword=query, max_num=1)
-
-        # Find the downloaded image file
-        image_files = [f for f in os.listdir(self.images_path) if f.startswith('p_')]
-        image_file = image_files[0] if image_files else None
-
-        # rename file by removing the prefix 'p_'
-        if image_file:
-            os.rename(os.path.join(self.images_path, image_file), os.path.join(self.images_path, image_file[2:]))
-            image_file = image_file[2:]
-        
-        # Cache the result before returning it and save to JSON file
-        if image_file:
-            self.cache[query] = image_file
-            self.save_cache()
-
-        image_file = 'default.png' if not image_file else image_file
-        
+        """
+        Return the file name of the image of the query, relative to the images folder.
+        Falls back to 'default.png' when no image can be downloaded.
+        """
+        with tracer.span('image_download', query=query) as span:
+            # Check if the query result is already cached
+            image_file = self.index.get(query)
+            cache_hit = bool(image_file) and os.path.exists(os.path.join(self.images_path, image_file))
+            span.set('cache_hit', cache_hit)
+            if cache_hit:
+                print(f"Cache hit for query: {query}")
+                return image_file
+
+            image_file, coalesced = self.flights.do(query, self._download, query, span)
+            span.set('coalesced', coalesced)
+            return image_file
+
+    def _download(self, query, span):
+        """
+        Download the image of the query, store it and index it.
+        The index is checked again first, a download of the same query may have completed since the cache miss.
+        """
+        image_file = self.index.get(query)
+        if image_file and os.path.exists(os.path.join(self.images_path, image_file)):
+            return image_file
+
+        try:
+            image = self.fetcher.fetch(query)
+        except Exception as e:
+            print(f"Error while downloading an image for {query}: {e}")
+            image = None
+        if not image:
+            return 'default.png'
+        span.set('bytes', len(image[0]))
+
+        image_file = self._store(*image)
+        self.index.set(query, image_file)
+        return image_file
+
+    def flight_stats(self):
+        """
+        Return the number of downloads and of identical concurrent downloads coalesced into them.
+        """
+        return self.flights.stats()
+
+    def _store(self, content, extension):
+        """
+        Store the image under the hash of its content, identical images are stored once.
+        """
+        image_file = f"{hashlib.sha256(content).hexdigest()[:32]}.{extension}"
+        image_path = os.path.join(self.images_path, image_file)
+        if not os.path.exists(image_path):
+            fd, temp_path = create_temp_file(self.images_path)
+            with os.fdopen(fd, 'wb') as f:
+                f.write(content)
+            os.replace(temp_path, image_path)
         return image_file
@@ -1,60 +1,66 @@
 # layout_manager.py
 
 class LayoutManager:
-    def __init__(self):
-        pass
+    def __init__(self, template):
+        """
+        Initialize the LayoutManager with the parsed template resolving the layout of each slide role.
+        """
+        self.template = template
+
+    def _add_slide(self, presentation, role):
+        """
+        Add a slide with the layout of the role, return it with its content placeholders ordered by idx.
+        """
+        slide_layout = presentation.slide_layouts[self.template.layout_index(role)]
+        slide = presentation.slides.add_slide(slide_layout)
+        return slide, [slide.placeholders[placeholder['idx']] for placeholder in self.template.content_placeholders(role)]
 
     def _create_title_slide(self, presentation, title, subtitle):
         """
         Create a title slide with the given title and subtitle.
         """
         print(f"Creating title slide with title: {title} and subtitle: {subtitle}")
-        slide_layout = presentation.slide_layouts[0]
-        slide = presentation.slides.add_slide(slide_layout)
+        slide, placeholders = self._add_slide(presentation, 'title')
         slide.shapes.title.text = title
-        slide.placeholders[1].text = subtitle
+        placeholders[0].text = subtitle
 
     def _create_title_and_content_slide(self, presentation, title, content):
         """
         Create a title and content slide with the given title and content.
         """
         print(f"Creating title and content slide with title: {title}")
-        slide_layout = presentation.slide_layouts[1]
-        slide = presentation.slides.add_slide(slide_layout)
+        slide, placeholders = self._add_slide(presentation, 'title_and_content')
         slide.shapes.title.text = title
-        slide.placeholders[1].text = content
+        placeholders[0].text = content
 
     def _create_two_content_slide(self, presentation, title, content_left, content_right):
         """
         Create a two-content slide with the given title and content.
         """
         print(f"Creating two content slide with title: {title}")
-        slide_layout = presentation.slide_layouts[3]
-        slide = presentation.slides.add_slide(slide_layout)
+        slide, placeholders = self._add_slide(presentation, 'two_content')
         slide.shapes.title.text = title
-        slide.placeholders[1].text = content_left
-        slide.placeholders[2].text = content_right
+        placeholders[0].text = content_left
+        placeholders[1].text = content_right
 
     def _create_comparison_slide(self, presentation, title, text_left, content_left, text_right, content_right):
         """
         Create a comparison slide with the given title and content.
         """
         print(f"Creating comparison slide with title: {title}")
-        slide_layout = presentation.slide_layouts[4]
-        slide = presentation.slides.add_slide(slide_layout)
+        slide, placeholders = self._add_slide(presentation, 'comparison')
         slide.shapes.title.text = title
-        slide.placeholders[1].text = text_left
-        slide.placeholders[2].text = content_left
-        slide.placeholders[3].text = text_right
-        slide.placeholders[4].text = content_right
+        placeholders[0].text = text_left
+        placeholders[1].text = content_left
+        placeholders[2].text = text_right
+        placeholders[3].text = content_right
 
     def _create_title_only_slide(self, presentation, title):
         """
         Create a title-only slide with the given title.
         """
         print(f"Creating title-only slide with title: {title}")
-        slide_layout = presentation.slide_layouts[5]
-        slide = presentation.slides.add_slide(slide_layout)
+        slide, _ = self._add_slide(presentation, 'title_only')
         slide.shapes.title.text = title
 
     def _create_blank_slide(self, presentation):
@@ -62,47 +68,55 @@ class LayoutManager:
         Create a blank slide.
         """
         print(f"Creating blank slide")
-        slide_layout = presentation.slide_layouts[6]
-        slide = presentation.slides.add_slide(slide_layout)
+        self._add_slide(presentation, 'blank')
 
     def _create_content_with_caption_slide(self, presentation, title, content, caption):
         """
         Create a content with caption slide with the given title, content, and caption.
         """
         print(f"Creating content with caption slide with title: {title}")
-        slide_layout = presentation.slide_layouts[7]
-        slide = presentation.slides.add_slide(slide_layout)
+        slide, placeholders = self._add_slide(presentation, 'content_with_caption')
         slide.shapes.title.text = title
-        slide.placeholders[1].text = content
-        slide.placeholders[2].text = caption
+        placeholders[0].text = content
+        placeholders[1].text = caption
+
+    def _get_picture_size(self, presentation):
+        """
+        Get the (width, height) in EMU of the picture placeholder of the picture with caption layout.
+        """
+        for placeholder in self.template.content_placeholders('picture_with_caption'):
+            if placeholder['type'] == 'PICTURE' and placeholder['width']:
+                return placeholder['width'], placeholder['height']
+        return presentation.slide_width, presentation.slide_height
 
     def _create_picture_with_caption_slide(self, presentation, title, picture, caption):
         """
         Create a picture with caption slide with the given title, picture, and caption.
         """
+        from pptx.enum.shapes import PP_PLACEHOLDER
+
         print(f"Creating picture with caption slide with title: {title}")
-        slide_layout = presentation.slide_layouts[8]
-        slide = presentation.slides.add_slide(slide_layout)
+        slide, placeholders = self._add_slide(presentation, 'picture_with_caption')
         slide.shapes.title.text = title
-        slide.placeholders[1].insert_picture(picture)
-        slide.placeholders[2].text = caption
+        picture_placeholder = next(p for p in placeholders if p.placeholder_format.type == PP_PLACEHOLDER.PICTURE)
+        caption_placeholder = next(p for p in placeholders if p is not picture_placeholder)
+        picture_placeholder.insert_picture(picture)
+        caption_placeholder.text = caption
 
     def _create_title_and_vertical_text_slide(self, presentation, title, vertical_text):
         """
         Create a title and vertical text slide with the given title and vertical text.
         """
         print(f"Creating title and vertical text slide with title: {title}")
-        slide_layout = presentation.slide_layouts[9]
-        slide = presentation.slides.add_slide(slide_layout)
+        slide, placeholders = self._add_slide(presentation, 'title_and_vertical_text')
         slide.shapes.title.text = title
-        slide.placeholders[1].text = vertical_text
+        placeholders[0].text = vertical_text
 
     def _create_vertical_title_and_text_slide(self, presentation, vertical_title, vertical_text):
         """
         Create a vertical title and text slide with the given vertical title and text.
         """
         print(f"Creating vertical title and text slide with title: {vertical_title}")
-        slide_layout = presentation.slide_layouts[10]
-        slide = presentation.slides.add_slide(slide_layout)
+        slide, placeholders = self._add_slide(presentation, 'vertical_title_and_text')
         slide.shapes.title.text = vertical_title
-        slide.placeholders[1].text = vertical_text
+        placeholders[0].text = vertical_text
@@ -0,0 +1,332 @@
+# maintenance.py
+import glob
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import time
+from core.cache_store import CacheStore
+from core.deck_manifest import DeckCheckpoint, DeckManifest
+from core.image_search import IMAGE_EXTENSIONS
+from core.similarity_cache import stale_signatures
+
+# Files of IMAGES_PATH that are never collected
+RESERVED_IMAGES = ('default.png', 'index.db', 'index.db-wal', 'index.db-shm')
+
+def database_bytes(db_file):
+    """
+    Return the size of a sqlite database with its WAL files.
+    """
+    return sum(os.path.getsize(db_file + suffix) for suffix in ('', '-wal', '-shm') if os.path.exists(db_file + suffix))
+
+def compact_database(db_file):
+    """
+    Rebuild a sqlite database without its free pages and truncate its WAL, return the bytes reclaimed.
+    The rebuild locks the database, readers and writers of other processes wait for it or fail
+    after their busy timeout: only compact while no presentation is generated.
+    """
+    before = database_bytes(db_file)
+    conn = sqlite3.connect(db_file, timeout=30, isolation_level=None)
+    try:
+        conn.execute("VACUUM")
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    except sqlite3.OperationalError as e:
+        print(f"Could not compact {db_file}: {e}")
+    finally:
+        conn.close()
+    return before - database_bytes(db_file)
+
+def checkpoint_database(db_file):
+    """
+    Copy the pages of the WAL of a sqlite database into the database without waiting for its readers and writers.
+    """
+    conn = sqlite3.connect(db_file, timeout=30, isolation_level=None)
+    try:
+        conn.execute("PRAGMA wal_checkpoint(PASSIVE)")
+    finally:
+        conn.close()
+
+def file_digest(path):
+    """
+    Return the sha256 hash of a file, read by chunks.
+    """
+    file_hash = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+class StoreMaintenance:
+    def __init__(self, config, grace=None):
+        """
+        Initialize the maintenance of the LLM, web, image and deck caches and of the image and deck files.
+        Files modified, and cache entries used, in the last grace seconds are never removed:
+        they may belong to a generation running in another process.
+        """
+        self.output_path = config.get('OUTPUT_PATH', 'output')
+        self.images_path = config.get('IMAGES_PATH', 'images')
+        self.variants_path = os.path.join(self.images_path, 'processed')
+        self.decks_path = os.path.join(self.output_path, 'deck_cache')
+        self.grace = config.get('MAINTENANCE_GRACE', 3600) if grace is None else grace
+        self.limits = {
+            'llm': (config.get('CACHE_MAX_BYTES', 0), config.get('CACHE_MAX_AGE', 0)),
+            'web': (0, config.get('WEB_CACHE_TTL', 86400)),
+            'images': (config.get('IMAGES_MAX_BYTES', 0), 0),
+            'decks': (0, config.get('DECK_CACHE_TTL', 86400)),
+            'similarity': (config.get('SIMILARITY_MAX_ENTRIES', 100000), config.get('SIMILARITY_MAX_AGE', 0)),
+        }
+        # The limits are applied by run(), not when the stores are opened
+        self.stores = {
+            'llm': CacheStore(os.path.join(self.output_path, 'cache.db')),
+            'web': CacheStore(os.path.join(self.output_path, 'web_cache.db')),
+            'images': CacheStore(os.path.join(self.images_path, 'index.db')),
+            'decks': CacheStore(os.path.join(self.decks_path, 'index.db')),
+        }
+        self.similarity_db = os.path.join(self.output_path, 'similarity.db')
+
+    def stats(self):
+        """
+        Return the entries, sizes and access ages of each cache, and the files and bytes of the image folders.
+        """
+        stats = {name: store.stats() for name, store in self.stores.items()}
+        if os.path.exists(self.similarity_db):
+            conn = sqlite3.connect(self.similarity_db, timeout=30)
+            try:
+                entries = conn.execute("SELECT COUNT(*) FROM signatures").fetchone()[0]
+            except sqlite3.OperationalError:
+                entries = 0
+            finally:
+                conn.close()
+            stats['similarity'] = {'entries': entries, 'file_bytes': database_bytes(self.similarity_db)}
+
+        for name, folder in (('image_files', self.images_path), ('processed_files', self.variants_path)):
+            files = [entry for entry in self._scan(folder) if entry.is_file() and entry.name not in RESERVED_IMAGES]
+            stats[name] = {'files': len(files), 'bytes': sum(entry.stat().st_size for entry in files)}
+        return stats
+
+    def run(self, dry_run=False, compact=False):
+        """
+        Evict the caches over their age and size limits, collect the unused image files and checkpoint the databases.
+        With compact, the databases are rebuilt to return their free pages to the disk, which blocks the generations
+        using them. Return a report of the removed entries and files and of the reclaimed bytes,
+        nothing is changed on a dry run.
+        """
+        report = {'evicted': {}, 'removed_files': {}, 'reclaimed_bytes': 0, 'compacted_bytes': 0, 'dry_run': dry_run}
+        for name in ('llm', 'web', 'decks'):
+            max_bytes, max_age = self.limits[name]
+            report['evicted'][name] = self.stores[name].evict(max_bytes, max_age, self.grace, dry_run)
+        report['evicted']['images'] = self._evict_images(dry_run)
+        report['evicted']['similarity'] = self._evict_similarity(dry_run)
+
+        removed = self._collect_images(dry_run)
+        report['relinked'] = removed.pop('relinked')
+        removed['decks'] = self._collect_decks()
+        for kind, paths in removed.items():
+            report['removed_files'][kind] = len(paths)
+            for path in paths:
+                report['reclaimed_bytes'] += self._remove(path, dry_run)
+
+        if not dry_run:
+            for db_file in [store.db_file for store in self.stores.values()] + [self.similarity_db]:
+                if not os.path.exists(db_file):
+                    continue
+                if compact:
+                    report['compacted_bytes'] += compact_database(db_file)
+                else:
+                    checkpoint_database(db_file)
+        return report
+
+    def _evict_similarity(self, dry_run):
+        """
+        Remove the slide texts of the similarity cache over SIMILARITY_MAX_AGE and SIMILARITY_MAX_ENTRIES.
+        Running generations keep them in memory until they restart.
+        """
+        if not os.path.exists(self.similarity_db):
+            return 0
+        conn = sqlite3.connect(self.similarity_db, timeout=30, isolation_level=None)
+        try:
+            stale = stale_signatures(conn, *self.limits['similarity'])
+            if not dry_run:
+                conn.executemany("DELETE FROM signatures WHERE key_hash = ?", [(key_hash,) for key_hash in stale])
+        except sqlite3.OperationalError:
+            # The database was created by a version without the signatures table
+            stale = []
+        finally:
+            conn.close()
+        return len(stale)
+
+    def _evict_images(self, dry_run):
+        """
+        Remove the least recently used image queries until the image files fit in IMAGES_MAX_BYTES.
+        The files of the removed queries are then collected as orphans.
+        """
+        max_bytes = self.limits['images'][0]
+        if not max_bytes:
+            return 0
+
+        index = self.stores['images']
+        entries = index.entries()
+        queries = {}
+        for _, image_file, _, _, _ in entries:
+            queries[image_file] = queries.get(image_file, 0) + 1
+        sizes = {image_file: self._size(os.path.join(self.images_path, image_file)) for image_file in queries}
+        excess = sum(sizes.values()) - max_bytes
+
+        stale = []
+        idle_before = time.time() - self.grace
+        for key_hash, image_file, _, _, accessed_at in entries:
+            if excess <= 0 or accessed_at >= idle_before:
+                break
+            stale.append(key_hash)
+            queries[image_file] -= 1
+            if not queries[image_file]:
+                # Last query of the file, the file and its processed variants are freed
+                excess -= sizes[image_file]
+        if not dry_run:
+            index.delete(stale)
+        return len(stale)
+
+    def _collect_images(self, dry_run):
+        """
+        Return the image files to remove by kind: temporary files of interrupted downloads and crawls,
+        legacy crawler files, imported JSON caches, files no query or deck references, duplicates
+        of another file and processed variants of removed originals.
+        The queries of a duplicate are re-pointed to the kept file, the duplicate is collected by a later run.
+        """
+        removed = {'temporary': [], 'legacy': [], 'orphans': [], 'duplicates': [], 'variants': [], 'relinked': 0}
+        index = self.stores['images']
+        referenced = self._referenced_images()
+        indexed = {os.path.realpath(os.path.join(self.images_path, image_file))
+                   for _, image_file, _, _, _ in index.entries()}
+        known = indexed | referenced
+
+        originals = []
+        for entry in self._scan(self.images_path):
+            if entry.name in RESERVED_IMAGES:
+                continue
+            if entry.name.startswith(('.tmp_', '.crawl_')):
+                if self._expired(entry):
+                    removed['temporary'].append(entry.path)
+            elif not entry.is_file():
+                continue
+            elif entry.name.startswith('p_') or entry.name.endswith('.migrated'):
+                if self._expired(entry):
+                    removed['legacy'].append(entry.path)
+            elif entry.name.rsplit('.', 1)[-1].lower() not in IMAGE_EXTENSIONS:
+                # Other files when IMAGES_PATH is shared, e.g. with OUTPUT_PATH
+                continue
+            elif os.path.realpath(entry.path) not in known:
+                if self._expired(entry):
+                    removed['orphans'].append(entry.path)
+            else:
+                originals.append(entry)
+
+        # Only files of the same size can be duplicates, the others are known by the hash in their name
+        by_size = {}
+        for entry in originals:
+            by_size.setdefault(entry.stat().st_size, []).append(entry)
+        by_hash = {}
+        for entries in by_size.values():
+            for entry in entries:
+                name_hash = entry.name.split('.', 1)[0]
+                if len(entries) == 1 and len(name_hash) == 32:
+                    by_hash[name_hash] = [entry]
+                else:
+                    by_hash.setdefault(file_digest(entry.path)[:32], []).append(entry)
+
+        for content_hash, entries in by_hash.items():
+            # Keep the file named after its content, as stored by the image searcher
+            entries.sort(key=lambda entry: (not entry.name.startswith(content_hash + '.'), entry.name))
+            for duplicate in entries[1:]:
+                if os.path.realpath(duplicate.path) in indexed:
+                    removed['relinked'] += 1
+                    if not dry_run:
+                        index.replace_value(duplicate.name, entries[0].name)
+                        # A running generation may have read the old name, it stays for the grace period
+                        os.utime(duplicate.path)
+                elif self._expired(duplicate) and os.path.realpath(duplicate.path) not in referenced:
+                    removed['duplicates'].append(duplicate.path)
+
+        for entry in self._scan(self.variants_path):
+            if not self._expired(entry):
+                continue
+            if entry.name.startswith('.tmp_'):
+                removed['temporary'].append(entry.path)
+            elif entry.name.split('_', 1)[0] not in by_hash and os.path.realpath(entry.path) not in referenced:
+                removed['variants'].append(entry.path)
+        return removed
+
+    def _collect_decks(self):
+        """
+        Return the files of the deck cache no entry references, e.g. the files of expired entries.
+        """
+        referenced = {'index.db', 'index.db-wal', 'index.db-shm'}
+        for _, artifact, _, _, _ in self.stores['decks'].entries():
+            artifact = json.loads(artifact)
+            referenced.update(name for name in (artifact['file'], artifact.get('manifest')) if name)
+        return [entry.path for entry in self._scan(self.decks_path)
+                if entry.name not in referenced and self._expired(entry)]
+
+    def _referenced_images(self):
+        """
+        Return the real paths of the images of the deck manifests and checkpoints, reused by incremental
+        and resumed generations.
+        """
+        referenced = set()
+        manifests = glob.glob(os.path.join(glob.escape(self.output_path), '**', '*.manifest.json'), recursive=True)
+        for path in manifests:
+            manifest = DeckManifest(path)
+            if manifest.load():
+                referenced.update(outputs.get('image') for outputs in manifest.slide_outputs().values())
+        for path in glob.glob(os.path.join(glob.escape(self.output_path), 'checkpoints', '*.jsonl')):
+            try:
+                referenced.update(outputs.get('image') for outputs in DeckCheckpoint(path).load().values())
+            except (OSError, KeyError):
+                continue
+        return {os.path.realpath(image) for image in referenced if image}
+
+    def _scan(self, folder):
+        """
+        Return the entries of a folder, none when it does not exist.
+        """
+        try:
+            with os.scandir(folder) as entries:
+                return list(entries)
+        except FileNotFoundError:
+            return []
+
+    def _expired(self, entry):
+        """
+        Check whether a file or folder was last modified before the grace period.
+        """
+        try:
+            return entry.stat().st_mtime < time.time() - self.grace
+        except FileNotFoundError:
+            return False
+
+    def _size(self, path):
+        """
+        Return the size of a file or of a folder, 0 when it no longer exists.
+        """
+        if os.path.isdir(path):
+            return sum(self._size(os.path.join(path, name)) for name in os.listdir(path))
+        try:
+            return os.path.getsize(path)
+        except FileNotFoundError:
+            return 0
+
+    def _remove(self, path, dry_run):
+        """
+        Remove a file or folder and return its size.
+        """
+        size = self._size(path)
+        if not dry_run:
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    return 0
+        return size
@@ -0,0 +1,74 @@
+# memory_cache.py
+from collections import OrderedDict
+import threading
+
+class LRUCache:
+    def __init__(self, max_entries=1024, max_bytes=0):
+        """
+        Initialize an in-memory least recently used cache of string values.
+        max_entries and max_bytes bound the cache, 0 disables the limit.
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bytes = 0
+
+    @staticmethod
+    def _size(key, value):
+        """
+        Approximate the memory held by an entry as the size of its strings.
+        """
+        return sum(len(part.encode('utf-8')) for part in key) + len(value.encode('utf-8'))
+
+    def get(self, key):
+        """
+        Return the value cached for the key (a tuple of strings) or None, and mark it as recently used.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value):
+        """
+        Store the value for the key, evicting the least recently used entries if the cache is full.
+        """
+        size = self._size(key, value)
+        if self.max_bytes and size > self.max_bytes:
+            return  # Would evict everything else
+
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.bytes -= previous[1]
+            self._entries[key] = (value, size)
+            self.bytes += size
+
+            while self._entries and ((self.max_entries and len(self._entries) > self.max_entries)
+                                     or (self.max_bytes and self.bytes > self.max_bytes)):
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.bytes -= evicted_size
+                self.evictions += 1
+
+    def stats(self):
+        """
+        Return the cache counters.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self.bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,150 @@
+# prompt_budget.py
+import re
+import threading
+from core.providers import configured_model
+
+# Characters per token of the estimate used when no tokenizer is available
+CHARS_PER_TOKEN = {'openai': 4.0, 'ollama': 3.5, 'stub': 4.0}
+# Separator of the search results in the web context
+SNIPPET_SEPARATOR = "\n---\n"
+# Snippets left with fewer tokens than this are dropped instead of truncated
+MIN_SNIPPET_TOKENS = 32
+
+STOP_WORDS = {'the', 'and', 'for', 'with', 'from', 'that', 'this', 'are', 'was', 'its', 'into', 'about', 'what', 'how'}
+
+class TokenCounter:
+    # Encodings of tiktoken by model, shared by all the counters
+    _encodings = {}
+    _lock = threading.Lock()
+
+    def __init__(self, provider, model):
+        """
+        Initialize a counter of the tokens of a provider and model.
+        OpenAI models are counted with tiktoken when it is installed, other models are estimated from the text length.
+        """
+        self.provider = provider
+        self.model = model
+        self.chars_per_token = CHARS_PER_TOKEN.get(provider, 4.0)
+        self.encoding = self._get_encoding() if provider == 'openai' else None
+
+    def count(self, text):
+        """
+        Return the number of tokens of a text.
+        """
+        if not text:
+            return 0
+        if self.encoding is not None:
+            return len(self.encoding.encode(text, disallowed_special=()))
+        return int(len(text) / self.chars_per_token + 0.999)
+
+    def truncate(self, text, tokens):
+        """
+        Cut a text at a word boundary so that it holds at most the given number of tokens.
+        """
+        if self.count(text) <= tokens:
+            return text
+        cut = text[:int(tokens * self.chars_per_token)]
+        while cut and self.count(cut) > tokens:
+            cut = cut[:int(len(cut) * 0.9)]
+        return cut.rsplit(' ', 1)[0] if ' ' in cut else cut
+
+    def _get_encoding(self):
+        """
+        Return the tiktoken encoding of the model, or None if tiktoken is not installed.
+        """
+        with self._lock:
+            if self.model not in self._encodings:
+                try:
+                    import tiktoken
+                except ImportError:
+                    self._encodings[self.model] = None
+                else:
+                    try:
+                        self._encodings[self.model] = tiktoken.encoding_for_model(self.model)
+                    except KeyError:
+                        self._encodings[self.model] = tiktoken.get_encoding('cl100k_base')
+            return self._encodings[self.model]
+
+class PromptBudget:
+    def __init__(self, config):
+        """
+        Initialize the budget of the web context embedded in the outline prompt.
+        CONTEXT_TOKEN_BUDGET caps the context, PROMPT_TOKEN_BUDGET caps the whole prompt for small context windows.
+        """
+        self.counter = TokenCounter(config['PROVIDER'], configured_model(config))
+        self.context_budget = config.get('CONTEXT_TOKEN_BUDGET', 1500)
+        self.prompt_budget = config.get('PROMPT_TOKEN_BUDGET', 0)
+
+    def fit(self, context, topic, fixed_tokens=0):
+        """
+        Keep the snippets of the context most relevant to the topic within the budget, in their original order.
+        fixed_tokens is the size of the rest of the prompt, counted against PROMPT_TOKEN_BUDGET.
+        Return the context and the token counts of the prompt parts.
+        """
+        budget = self.context_budget or float('inf')
+        if self.prompt_budget:
+            budget = max(0, min(budget, self.prompt_budget - fixed_tokens))
+
+        snippets = split_snippets(context)
+        context_tokens = self.counter.count(context)
+        stats = {'fixed_tokens': fixed_tokens, 'context_tokens': context_tokens, 'snippets': len(snippets)}
+
+        if context_tokens <= budget:
+            kept, trimmed = snippets, context
+        else:
+            # Fill the budget with the best ranked snippets, the last one may be truncated
+            separator = self.counter.count(SNIPPET_SEPARATOR)
+            chosen, used = {}, 0
+            for index in rank_snippets(snippets, topic):
+                remaining = budget - used - separator
+                size = self.counter.count(snippets[index])
+                if size <= remaining:
+                    chosen[index] = snippets[index]
+                    used += size + separator
+                elif remaining >= MIN_SNIPPET_TOKENS:
+                    chosen[index] = self.counter.truncate(snippets[index], remaining)
+                    used += self.counter.count(chosen[index]) + separator
+            kept = [chosen[index] for index in sorted(chosen)]
+            trimmed = SNIPPET_SEPARATOR.join(kept)
+
+        stats['kept_snippets'] = len(kept)
+        stats['kept_tokens'] = self.counter.count(trimmed)
+        stats['saved_tokens'] = context_tokens - stats['kept_tokens']
+        return trimmed, stats
+
+def split_snippets(context):
+    """
+    Split a web context into snippets: the search results when they are separated by '---', the paragraphs otherwise.
+    Repeated snippets are kept once.
+    """
+    context = (context or '').strip()
+    if not context:
+        return []
+    parts = context.split(SNIPPET_SEPARATOR) if SNIPPET_SEPARATOR in context else re.split(r'\n\s*\n', context)
+
+    snippets, seen = [], set()
+    for part in parts:
+        part = part.strip()
+        normalized = ' '.join(part.lower().split())
+        if part and normalized not in seen:
+            seen.add(normalized)
+            snippets.append(part)
+    return snippets
+
+def rank_snippets(snippets, topic):
+    """
+    Return the indexes of the snippets, most relevant to the topic first.
+    A snippet scores the topic words it contains, per word of the snippet so long snippets are not favored,
+    earlier search results win ties.
+    """
+    topic_words = {word for word in re.findall(r'\w+', topic.lower()) if len(word) > 2 and word not in STOP_WORDS}
+
+    def score(index):
+        words = re.findall(r'\w+', snippets[index].lower())
+        if not words or not topic_words:
+            return 0.0
+        matches = sum(1 for word in words if word in topic_words)
+        coverage = len(topic_words.intersection(words)) / len(topic_words)
+        return coverage + matches / len(words)
+
+    return sorted(range(len(snippets)), key=lambda index: (-score(index), index))
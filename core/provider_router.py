@@ -0,0 +1,230 @@
+# provider_router.py
+import json
+import threading
+import time
+from core.providers import PROVIDERS
+from core.scheduler import RequestScheduler
+from core.tracing import estimate_tokens
+
+# Request roles: the outline of a presentation, and the cheaper slide expansions and other short requests
+ROLES = ('outline', 'expansion')
+
+class Backend:
+    def __init__(self, name, provider, roles, model_id):
+        """
+        Hold a provider registered in the router with its roles and its observed latency and errors.
+        model_id names the provider and model answering the requests, e.g. 'openai/gpt-4o'.
+        """
+        self.name = name
+        self.provider = provider
+        self.roles = roles
+        self.model_id = model_id
+        self.in_flight = 0
+        self.requests = 0
+        self.errors = 0
+        self.latency = {}
+        self.down_until = 0.0
+        self.last_error = None
+
+class ProviderRouter:
+    def __init__(self, backends, cooldown=30, alpha=0.3, scheduler=None):
+        """
+        Initialize the router sending each request to one of the backends serving its role.
+        The backend with the lowest observed latency times in-flight requests is chosen, a backend
+        failing a request is skipped for cooldown seconds and the request is sent to the next one.
+        alpha is the weight of the last request in the moving average of the latencies.
+        The scheduler queues the requests of each backend within its rate limits, by priority.
+        """
+        self.backends = backends
+        self.cooldown = cooldown
+        self.alpha = alpha
+        self.scheduler = scheduler or RequestScheduler()
+        for backend in backends:
+            if backend.name not in self.scheduler.providers:
+                self.scheduler.add_provider(backend.name)
+        self._lock = threading.Lock()
+
+    def complete(self, message, role='expansion', job=None):
+        """
+        Get the full response of a backend of the role, failing over to the next backends on errors.
+        job is the JobContext of the request, giving its priority.
+        """
+        error = None
+        prompt_tokens = estimate_tokens(message)
+        for backend in self._candidates(role):
+            ticket = self.scheduler.acquire(backend.name, prompt_tokens, role, job)
+            start = self._begin(backend)
+            try:
+                response = backend.provider.complete(message)
+            except Exception as e:
+                self.scheduler.release(ticket)
+                self._fail(backend, e)
+                error = e
+                continue
+            self.scheduler.release(ticket, estimate_tokens(response))
+            self._end(backend, role, start)
+            return response
+        raise error
+
+    def stream(self, message, role='expansion', job=None):
+        """
+        Stream the response of a backend of the role. The request fails over to the next backends
+        until the first chunk is received, later errors are raised.
+        """
+        error = None
+        prompt_tokens = estimate_tokens(message)
+        for backend in self._candidates(role):
+            ticket = self.scheduler.acquire(backend.name, prompt_tokens, role, job)
+            start = self._begin(backend)
+            chunks = backend.provider.stream(message)
+            try:
+                first = next(chunks, None)
+            except Exception as e:
+                self.scheduler.release(ticket)
+                self._fail(backend, e)
+                error = e
+                continue
+
+            response_tokens = 0
+            try:
+                if first is not None:
+                    response_tokens += estimate_tokens(first)
+                    yield first
+                for chunk in chunks:
+                    response_tokens += estimate_tokens(chunk)
+                    yield chunk
+            except GeneratorExit:
+                chunks.close()
+                self._end(backend, role, start)
+                raise
+            except Exception as e:
+                self._fail(backend, e)
+                raise
+            finally:
+                self.scheduler.release(ticket, response_tokens)
+            self._end(backend, role, start)
+            return
+        raise error
+
+    def identity(self, role):
+        """
+        Return the providers and models that may answer a request of the role, e.g. 'ollama/llama3,openai/gpt-4o'.
+        Responses are cached under it, a response is only reused by the same backends.
+        """
+        eligible = [backend for backend in self.backends if role in backend.roles] or self.backends
+        return ','.join(sorted({backend.model_id for backend in eligible}))
+
+    def stats(self):
+        """
+        Return the requests, errors, in-flight requests and average latency per role of each backend.
+        """
+        now = time.time()
+        with self._lock:
+            return [
+                {
+                    'name': backend.name,
+                    'roles': list(backend.roles),
+                    'requests': backend.requests,
+                    'errors': backend.errors,
+                    'in_flight': backend.in_flight,
+                    'latency': {role: round(latency, 4) for role, latency in backend.latency.items()},
+                    'down_seconds': round(max(0.0, backend.down_until - now), 1),
+                    'last_error': backend.last_error,
+                }
+                for backend in self.backends
+            ]
+
+    def close(self):
+        """
+        Close the connections of all the backends.
+        """
+        for backend in self.backends:
+            backend.provider.close()
+
+    def _candidates(self, role):
+        """
+        Return the backends of the role, the best first. Backends in cooldown come last, they are only
+        tried when all the others failed.
+        """
+        eligible = [backend for backend in self.backends if role in backend.roles] or self.backends
+        now = time.time()
+        with self._lock:
+            return sorted(eligible, key=lambda backend: (backend.down_until > now, not self.scheduler.ready(backend.name),
+                                                         backend.latency.get(role, 0.0) * (backend.in_flight + 1)))
+
+    def _begin(self, backend):
+        """
+        Count a request sent to a backend and return its start time.
+        """
+        with self._lock:
+            backend.in_flight += 1
+            backend.requests += 1
+        return time.perf_counter()
+
+    def _end(self, backend, role, start):
+        """
+        Record the latency of a successful request.
+        """
+        latency = time.perf_counter() - start
+        with self._lock:
+            backend.in_flight -= 1
+            previous = backend.latency.get(role)
+            backend.latency[role] = latency if previous is None else self.alpha * latency + (1 - self.alpha) * previous
+            backend.down_until = 0.0
+
+    def _fail(self, backend, error):
+        """
+        Record a failed request and put the backend in cooldown.
+        """
+        print(f"Backend {backend.name} failed: {error}")
+        with self._lock:
+            backend.in_flight -= 1
+            backend.errors += 1
+            backend.last_error = f"{type(error).__name__}: {error}"
+            backend.down_until = time.time() + self.cooldown
+
+def create_router(config):
+    """
+    Create the router of the backends listed as JSON in the BACKENDS setting, for example
+    [{"name": "gpt", "provider": "openai", "model": "gpt-4o", "roles": ["outline"]},
+     {"name": "local", "provider": "ollama", "host": "http://localhost:11434", "model": "llama3", "roles": ["expansion"]}].
+    Missing keys default to PROVIDER, HOST, API_KEY and MODEL. Without BACKENDS, the router has the single
+    backend of these settings. The rpm, tpm and concurrency keys of a backend default to PROVIDER_RPM,
+    PROVIDER_TPM and PROVIDER_CONCURRENCY, the rate limits are divided between the RATE_LIMIT_SHARES processes.
+    """
+    specs = config.get('BACKENDS') or []
+    if isinstance(specs, str):
+        specs = json.loads(specs)
+    if not specs:
+        specs = [{}]
+
+    backends = []
+    scheduler = RequestScheduler()
+    shares = max(1, config.get('RATE_LIMIT_SHARES', 1))
+    for number, spec in enumerate(specs):
+        provider_name = spec.get('provider', config['PROVIDER'])
+        provider_cls = PROVIDERS.get(provider_name)
+        if provider_cls is None:
+            raise ValueError("Unsupported provider")
+        roles = tuple(spec.get('roles', ROLES))
+        if any(role not in ROLES for role in roles):
+            raise ValueError(f"Unknown backend role in {roles}, expected {ROLES}")
+
+        backend_config = dict(config)
+        backend_config.update({
+            'PROVIDER': provider_name,
+            'HOST': spec.get('host', config['HOST']),
+            'API_KEY': spec.get('api_key', config['API_KEY']),
+            'MODEL': spec.get('model', config.get('MODEL')),
+            # With several backends, a failing request moves to the next backend instead of being retried
+            'MAX_RETRIES': spec.get('max_retries', config.get('MAX_RETRIES', 3) if len(specs) == 1 else 0),
+            'PROVIDER_CONCURRENCY': spec.get('concurrency', config.get('PROVIDER_CONCURRENCY', 8)),
+        })
+        name = spec.get('name', f"{provider_name}-{number}")
+        provider = provider_cls(backend_config)
+        backends.append(Backend(name, provider, roles, f"{provider_name}/{provider.model}"))
+        scheduler.add_provider(name, rpm=spec.get('rpm', config.get('PROVIDER_RPM', 0)) / shares,
+                               tpm=spec.get('tpm', config.get('PROVIDER_TPM', 0)) / shares,
+                               concurrency=backend_config['PROVIDER_CONCURRENCY'])
+
+    return ProviderRouter(backends, cooldown=config.get('FAILOVER_COOLDOWN', 30), scheduler=scheduler)
@@ -0,0 +1,305 @@
+# providers.py
+from contextlib import contextmanager
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+
+class RetryableError(Exception):
+    """
+    Raised for the provider errors worth retrying: timeouts, connection errors, 429 and 5xx responses.
+    """
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class BaseProvider:
+    # Model used when MODEL is not set, None when the provider has no sensible default
+    DEFAULT_MODEL = None
+
+    def __init__(self, config):
+        """
+        Initialize the provider with its own credentials and a pooled HTTP client,
+        connections are kept alive and shared by all the threads using the provider.
+        """
+        self.host = config['HOST'].rstrip('/')
+        self.api_key = config['API_KEY']
+        self.model = config.get('MODEL') or self.DEFAULT_MODEL
+        if not self.model:
+            raise ValueError(f"MODEL must be set for the {config.get('PROVIDER')} provider")
+        self.max_retries = config.get('MAX_RETRIES', 3)
+        self.backoff = config.get('RETRY_BACKOFF', 1.0)
+        concurrency = max(1, config.get('PROVIDER_CONCURRENCY', 8))
+        self._slots = threading.BoundedSemaphore(concurrency)
+
+        # httpx is imported with the first HTTP provider, the stub provider does not need it
+        import httpx
+        headers = {"Authorization": f"Bearer {self.api_key}"} if self.api_key else {}
+        self.client = httpx.Client(
+            headers=headers,
+            timeout=httpx.Timeout(config.get('REQUEST_TIMEOUT', 120), connect=10),
+            limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency))
+
+    def complete(self, message):
+        """
+        Get the full response of the model for the message.
+        """
+        raise NotImplementedError
+
+    def stream(self, message):
+        """
+        Get the response of the model for the message as a stream of text chunks.
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """
+        Close the pooled connections.
+        """
+        self.client.close()
+
+    def _post(self, url, payload):
+        """
+        Send a POST request and return its JSON response, retrying on transient errors.
+        """
+        import httpx
+
+        def send():
+            try:
+                response = self.client.post(url, json=payload)
+            except (httpx.TimeoutException, httpx.TransportError) as e:
+                raise RetryableError(f"{type(e).__name__}: {e}")
+            self._check_status(response)
+            return response.json()
+
+        with self._slots:
+            return self._with_retries(send)
+
+    @contextmanager
+    def _post_stream(self, url, payload):
+        """
+        Send a POST request and yield its streamed response, retrying on transient errors
+        until the response headers are received.
+        """
+        import httpx
+
+        with self._slots:
+            def open_stream():
+                request = self.client.build_request("POST", url, json=payload)
+                try:
+                    response = self.client.send(request, stream=True)
+                except (httpx.TimeoutException, httpx.TransportError) as e:
+                    raise RetryableError(f"{type(e).__name__}: {e}")
+                try:
+                    self._check_status(response)
+                except Exception:
+                    response.close()
+                    raise
+                return response
+
+            response = self._with_retries(open_stream)
+            try:
+                yield response
+            finally:
+                response.close()
+
+    def _check_status(self, response):
+        """
+        Raise a RetryableError for 429 and 5xx responses, and an HTTPStatusError for other errors.
+        """
+        if response.status_code == 429 or response.status_code >= 500:
+            retry_after = response.headers.get('Retry-After')
+            raise RetryableError(f"HTTP {response.status_code} from {response.url}",
+                                 float(retry_after) if retry_after and retry_after.isdigit() else None)
+        response.raise_for_status()
+
+    def _with_retries(self, send):
+        """
+        Call send, retrying with exponential backoff and jitter while it raises a RetryableError.
+        """
+        for attempt in range(self.max_retries + 1):
+            try:
+                return send()
+            except RetryableError as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = e.retry_after or self.backoff * (2 ** attempt) * (0.5 + random.random())
+                print(f"{e}, retrying in {delay:.1f}s")
+                time.sleep(delay)
+
+class OpenAIProvider(BaseProvider):
+    DEFAULT_MODEL = 'gpt-3.5-turbo'
+
+    def __init__(self, config):
+        """
+        Initialize the provider for OpenAI and OpenAI-compatible chat completion endpoints.
+        """
+        super().__init__(config)
+        # The host may be given with or without the API version
+        self.base_url = self.host if self.host.endswith('/v1') else f"{self.host}/v1"
+
+    def complete(self, message):
+        """
+        Get the response from the chat completion endpoint.
+        """
+        response = self._post(f"{self.base_url}/chat/completions", self._payload(message, False))
+        return response['choices'][0]['message']['content']
+
+    def stream(self, message):
+        """
+        Stream the response from the chat completion endpoint, sent as 'data: {json}' events.
+        """
+        with self._post_stream(f"{self.base_url}/chat/completions", self._payload(message, True)) as response:
+            for line in response.iter_lines():
+                if not line.startswith('data:'):
+                    continue
+                data = line[len('data:'):].strip()
+                if data == '[DONE]':
+                    break
+                chunk = json.loads(data)
+                if chunk.get('choices') and chunk['choices'][0].get('delta', {}).get('content'):
+                    yield chunk['choices'][0]['delta']['content']
+
+    def _payload(self, message, stream):
+        """
+        Build the chat completion request body.
+        """
+        return {"model": self.model, "messages": [{"role": "user", "content": message}], "stream": stream}
+
+class OllamaProvider(BaseProvider):
+    def complete(self, message):
+        """
+        Get the response from the Ollama generate endpoint.
+        """
+        response = self._post(f"{self.host}/api/generate", self._payload(message, False))
+        return response['response']
+
+    def stream(self, message):
+        """
+        Stream the response from the Ollama generate endpoint, which sends one JSON object per line.
+        """
+        with self._post_stream(f"{self.host}/api/generate", self._payload(message, True)) as response:
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                if chunk.get('response'):
+                    yield chunk['response']
+                if chunk.get('done'):
+                    break
+
+    def _payload(self, message, stream):
+        """
+        Build the generate request body.
+        """
+        return {"model": self.model, "prompt": message, "stream": stream}
+
+class StubProvider(BaseProvider):
+    DEFAULT_MODEL = 'stub'
+
+    def __init__(self, config):
+        """
+        Initialize an offline provider answering with deterministic canned texts after a fixed latency.
+        Outline prompts get a tagged outline of the requested number of slides, other prompts a short slide text.
+        Used by the benchmarks, STUB_LATENCY is the delay of a request and STUB_CHUNK_LATENCY the delay of each chunk.
+        """
+        self.model = config.get('MODEL') or self.DEFAULT_MODEL
+        self.latency = config.get('STUB_LATENCY', 0.05)
+        self.chunk_latency = config.get('STUB_CHUNK_LATENCY', 0.0)
+        self.chunk_size = config.get('STUB_CHUNK_SIZE', 64)
+        self._slots = threading.BoundedSemaphore(max(1, config.get('PROVIDER_CONCURRENCY', 8)))
+
+    def complete(self, message):
+        """
+        Get the canned response after the latency of the request and of all its chunks.
+        """
+        response = self._respond(message)
+        with self._slots:
+            time.sleep(self.latency + self.chunk_latency * len(self._chunks(response)))
+        return response
+
+    def stream(self, message):
+        """
+        Stream the canned response in chunks of STUB_CHUNK_SIZE characters.
+        """
+        with self._slots:
+            time.sleep(self.latency)
+            for chunk in self._chunks(self._respond(message)):
+                time.sleep(self.chunk_latency)
+                yield chunk
+
+    def close(self):
+        """
+        Nothing to close, the stub has no connection.
+        """
+
+    def _chunks(self, response):
+        """
+        Split a response in chunks.
+        """
+        return [response[i:i + self.chunk_size] for i in range(0, len(response), self.chunk_size)] or ['']
+
+    def _respond(self, message):
+        """
+        Build the canned response of a prompt.
+        """
+        outline = re.search(r"on the topic of (.*?) which is (\d+)\s+slides long", message, re.DOTALL)
+        if outline:
+            return self._outline(outline.group(1).strip(), int(outline.group(2)))
+        batch = re.search(r"for each of the following (\d+) slides", message)
+        if batch:
+            return "\n".join(f"[RESULT {number}]\n{self._text(message + str(number))}\n[/RESULT {number}]"
+                             for number in range(1, int(batch.group(1)) + 1))
+        return self._text(message)
+
+    def _outline(self, topic, slides):
+        """
+        Build an outline of the topic with a title slide, content, image and two content slides, and a thanks slide.
+        """
+        parts = [f"[L_TS]\n[TITLE]{topic}[/TITLE]\n[SUBTITLE]An overview[/SUBTITLE]"]
+        for number in range(1, slides - 1):
+            title = f"{topic} part {number}"
+            content = "\n".join(f"- Point {point} about {title}" for point in range(1, 4))
+            layout = ("[L_CS]", "[L_IS]", "[L_TCS]")[number % 3]
+            if layout == "[L_TCS]":
+                body = f"[CONTENT]\n{content}\n[/CONTENT]\n[CONTENT]\n{content}\n[/CONTENT]"
+            elif layout == "[L_IS]":
+                body = f"[CONTENT]\n{content}\n[/CONTENT]\n[IMAGE]{title}[/IMAGE]"
+            else:
+                body = f"[CONTENT]\n{content}\n[/CONTENT]"
+            parts.append(f"{layout}\n[TITLE]{title}[/TITLE]\n{body}")
+        if slides > 1:
+            parts.append("[L_THS]\n[TITLE]Thank you[/TITLE]")
+        return "\n\n[SLIDEBREAK]\n\n".join(parts)
+
+    def _text(self, message):
+        """
+        Build a slide text depending only on the prompt.
+        """
+        seed = hashlib.sha256(message.encode('utf-8')).hexdigest()[:8]
+        return f"This slide text {seed} explains the topic in three sentences. " \
+               "It gives an example of the idea. It ends with a short conclusion."
+
+PROVIDERS = {
+    'openai': OpenAIProvider,
+    'ollama': OllamaProvider,
+    'stub': StubProvider,
+}
+
+def create_provider(config):
+    """
+    Create the provider selected by the PROVIDER setting.
+    """
+    provider_cls = PROVIDERS.get(config['PROVIDER'])
+    if provider_cls is None:
+        raise ValueError("Unsupported provider")
+    return provider_cls(config)
+
+def configured_model(config):
+    """
+    Return the model of the configured PROVIDER: MODEL, or the default model of the provider.
+    """
+    provider_cls = PROVIDERS.get(config['PROVIDER'])
+    return config.get('MODEL') or (provider_cls.DEFAULT_MODEL if provider_cls else None)
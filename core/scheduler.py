@@ -0,0 +1,269 @@
+# scheduler.py
+from collections import OrderedDict, deque
+import threading
+import time
+
+# Priority of the jobs, highest first
+PRIORITIES = ('interactive', 'batch')
+# Priority of the requests of a job, highest first: the outline, then the slide expansions and other requests
+REQUEST_ROLES = ('outline', 'expansion')
+# Initial estimate of the response tokens of each role, refined with the responses
+RESPONSE_TOKENS = {'outline': 800, 'expansion': 200}
+
+def priority_class(priority, role):
+    """
+    Return the index of the priority class of a request, 0 is served first.
+    """
+    return PRIORITIES.index(priority) * len(REQUEST_ROLES) + REQUEST_ROLES.index(role)
+
+class SystemClock:
+    """
+    Clock of the scheduler in production, in seconds.
+    """
+    def now(self):
+        return time.monotonic()
+
+class SimulatedClock:
+    """
+    Clock moved forward by hand, to test the scheduler without waiting.
+    """
+    def __init__(self, start=0.0):
+        self.time = start
+
+    def now(self):
+        return self.time
+
+    def advance(self, seconds):
+        """
+        Move the clock forward.
+        """
+        self.time += seconds
+
+class JobContext:
+    def __init__(self, job_id=None, priority='interactive'):
+        """
+        Identify the job a request belongs to. The scheduler shares a provider fairly between
+        the jobs of a priority, and serves the interactive jobs before the batch jobs.
+        """
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority {priority}, expected one of {PRIORITIES}")
+        self.job_id = job_id
+        self.priority = priority
+
+class TokenBucket:
+    def __init__(self, per_minute, clock):
+        """
+        Initialize a bucket refilled with per_minute units per minute, holding at most one minute of units.
+        A bucket of 0 units per minute does not limit anything.
+        """
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.level = float(per_minute)
+        self.clock = clock
+        self.updated = clock.now()
+
+    def delay(self, amount):
+        """
+        Return the seconds before the amount can be taken. An amount larger than the capacity
+        waits for a full bucket, so it is not blocked forever.
+        """
+        if not self.capacity:
+            return 0.0
+        self._refill()
+        missing = min(amount, self.capacity) - self.level
+        return missing / self.rate if missing > 0 else 0.0
+
+    def take(self, amount):
+        """
+        Take an amount, the level goes below 0 when the amount was underestimated.
+        """
+        if self.capacity:
+            self._refill()
+            self.level -= amount
+
+    def _refill(self):
+        """
+        Add the units earned since the last update.
+        """
+        now = self.clock.now()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+class Ticket:
+    def __init__(self, provider, job, role, prompt_tokens, response_tokens, enqueued_at):
+        """
+        Hold a request waiting for, or holding, a slot of a provider.
+        The estimates of its prompt and response tokens are taken from the token bucket.
+        """
+        self.provider = provider
+        self.job = job
+        self.role = role
+        self.response_tokens = response_tokens
+        self.tokens = prompt_tokens + response_tokens
+        self.enqueued_at = enqueued_at
+        self.granted_at = None
+
+class ProviderQueue:
+    def __init__(self, name, rpm, tpm, concurrency, clock):
+        """
+        Hold the limits of a provider and its waiting requests: a queue per priority class,
+        each one holding a queue per job served in turn.
+        """
+        self.name = name
+        self.requests = TokenBucket(rpm, clock)
+        self.tokens = TokenBucket(tpm, clock)
+        self.concurrency = concurrency
+        self.in_flight = 0
+        self.classes = [OrderedDict() for _ in range(len(PRIORITIES) * len(REQUEST_ROLES))]
+        self.waiting = 0
+        self.granted = 0
+        self.wait_sum = 0.0
+        self.wait_max = 0.0
+
+    def head(self):
+        """
+        Return the next request to serve: the first class with waiting requests, then the job whose turn it is.
+        """
+        for jobs in self.classes:
+            if jobs:
+                return next(iter(jobs.values()))[0]
+        return None
+
+    def delay(self, tokens):
+        """
+        Return the seconds before a request of the estimated tokens can start, None while the provider
+        is at its concurrency.
+        """
+        if self.concurrency and self.in_flight >= self.concurrency:
+            return None
+        return max(self.requests.delay(1), self.tokens.delay(tokens))
+
+class RequestScheduler:
+    def __init__(self, clock=None):
+        """
+        Initialize the scheduler of the outbound LLM requests. Each provider has token buckets of requests
+        and estimated tokens per minute and a maximum of concurrent requests. Waiting requests are served
+        by priority class: interactive before batch jobs, outlines before slide expansions.
+        Within a class, the jobs are served in turn so a large job does not hold back the others.
+        """
+        self.clock = clock or SystemClock()
+        self.providers = {}
+        self.response_tokens = dict(RESPONSE_TOKENS)
+        self._condition = threading.Condition()
+
+    def add_provider(self, name, rpm=0, tpm=0, concurrency=0):
+        """
+        Register a provider with its requests and tokens per minute and its concurrency, 0 means no limit.
+        """
+        with self._condition:
+            self.providers[name] = ProviderQueue(name, rpm, tpm, concurrency, self.clock)
+
+    def submit(self, provider, prompt_tokens, role='expansion', job=None):
+        """
+        Queue a request and return its ticket, granted right away when the provider has capacity.
+        """
+        job = job or JobContext()
+        role = role if role in REQUEST_ROLES else REQUEST_ROLES[-1]
+        with self._condition:
+            queue = self.providers[provider]
+            ticket = Ticket(provider, job, role, prompt_tokens, self.response_tokens[role], self.clock.now())
+            queue.classes[priority_class(job.priority, role)].setdefault(job.job_id, deque()).append(ticket)
+            queue.waiting += 1
+            self._dispatch(queue)
+            return ticket
+
+    def acquire(self, provider, prompt_tokens, role='expansion', job=None):
+        """
+        Wait until a request can be sent to the provider and return its ticket, to release once the request is done.
+        """
+        ticket = self.submit(provider, prompt_tokens, role, job)
+        with self._condition:
+            while ticket.granted_at is None:
+                queue = self.providers[provider]
+                head = queue.head()
+                delay = queue.delay(head.tokens) if head is not None else None
+                # Wait for a release, or for the token buckets to refill
+                self._condition.wait(delay or None)
+                self._dispatch(queue)
+        return ticket
+
+    def release(self, ticket, response_tokens=None):
+        """
+        Free the slot of a finished request. The actual response tokens correct the estimate
+        taken from the token bucket and the estimate of the next requests.
+        """
+        with self._condition:
+            queue = self.providers[ticket.provider]
+            queue.in_flight -= 1
+            if response_tokens is not None:
+                queue.tokens.take(response_tokens - ticket.response_tokens)
+                estimate = self.response_tokens[ticket.role]
+                self.response_tokens[ticket.role] = 0.8 * estimate + 0.2 * response_tokens
+            self._dispatch(queue)
+            self._condition.notify_all()
+
+    def poll(self):
+        """
+        Grant the waiting requests that can start now, e.g. after a simulated clock moved forward.
+        """
+        with self._condition:
+            for queue in self.providers.values():
+                self._dispatch(queue)
+
+    def ready(self, provider):
+        """
+        Check whether a new request of the provider would start without waiting.
+        """
+        with self._condition:
+            queue = self.providers[provider]
+            return not queue.waiting and queue.delay(self.response_tokens['expansion']) == 0
+
+    def stats(self):
+        """
+        Return the waiting and running requests, and the wait times, of each provider.
+        """
+        with self._condition:
+            return {
+                name: {
+                    'waiting': queue.waiting,
+                    'waiting_by_class': {
+                        f"{priority}_{role}": sum(map(len, queue.classes[priority_class(priority, role)].values()))
+                        for priority in PRIORITIES for role in REQUEST_ROLES},
+                    'in_flight': queue.in_flight,
+                    'granted': queue.granted,
+                    'wait_seconds_sum': round(queue.wait_sum, 4),
+                    'wait_seconds_max': round(queue.wait_max, 4),
+                    'mean_wait_seconds': round(queue.wait_sum / queue.granted, 4) if queue.granted else 0.0,
+                }
+                for name, queue in self.providers.items()
+            }
+
+    def _dispatch(self, queue):
+        """
+        Grant the waiting requests of a provider in order while it has capacity, the lock must be held.
+        """
+        granted = False
+        while True:
+            ticket = queue.head()
+            if ticket is None or queue.delay(ticket.tokens) != 0:
+                break
+
+            jobs = queue.classes[priority_class(ticket.job.priority, ticket.role)]
+            tickets = jobs.pop(ticket.job.job_id)
+            tickets.popleft()
+            if tickets:
+                # The job goes back to the end of its class, the next job takes its turn
+                jobs[ticket.job.job_id] = tickets
+
+            queue.requests.take(1)
+            queue.tokens.take(ticket.tokens)
+            queue.in_flight += 1
+            queue.waiting -= 1
+            ticket.granted_at = self.clock.now()
+            wait = ticket.granted_at - ticket.enqueued_at
+            queue.granted += 1
+            queue.wait_sum += wait
+            queue.wait_max = max(queue.wait_max, wait)
+            granted = True
+        if granted:
+            self._condition.notify_all()
@@ -0,0 +1,216 @@
+# similarity_cache.py
+from array import array
+import hashlib
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+
+# Large prime of the universal hash functions of the MinHash permutations
+MERSENNE_PRIME = (1 << 61) - 1
+MAX_HASH = (1 << 32) - 1
+
+def shingles(text, size=5):
+    """
+    Return the set of character n-grams of a text normalized for case, punctuation and whitespace.
+    """
+    text = ' '.join(re.findall(r'\w+', text.lower()))
+    if len(text) <= size:
+        return {text} if text else set()
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+class MinHasher:
+    def __init__(self, num_perm=64, seed=1):
+        """
+        Initialize the MinHash functions, signatures of the same num_perm and seed are comparable.
+        """
+        rng = random.Random(seed)
+        self.num_perm = num_perm
+        self.permutations = [(rng.randrange(1, MERSENNE_PRIME), rng.randrange(0, MERSENNE_PRIME))
+                             for _ in range(num_perm)]
+
+    def signature(self, text):
+        """
+        Return the MinHash signature of the shingles of a text.
+        """
+        hashes = [int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=4).digest(), 'little')
+                  for shingle in shingles(text)]
+        if not hashes:
+            return array('I', [MAX_HASH] * self.num_perm)
+        return array('I', [min(((a * value + b) % MERSENNE_PRIME) & MAX_HASH for value in hashes)
+                           for a, b in self.permutations])
+
+def stale_signatures(conn, max_entries=0, max_age=0):
+    """
+    Return the key hashes of the stored signatures older than max_age seconds, then of the oldest ones
+    beyond max_entries, 0 disables a limit.
+    """
+    stale = []
+    if max_age:
+        stale += [key_hash for key_hash, in conn.execute("SELECT key_hash FROM signatures WHERE created_at < ?",
+                                                         (time.time() - max_age,))]
+    if max_entries:
+        expired = set(stale)
+        excess = conn.execute("SELECT COUNT(*) FROM signatures").fetchone()[0] - len(expired) - max_entries
+        for key_hash, in conn.execute("SELECT key_hash FROM signatures ORDER BY created_at"):
+            if excess <= 0:
+                break
+            if key_hash not in expired:
+                stale.append(key_hash)
+                excess -= 1
+    return stale
+
+def similarity(signature, other):
+    """
+    Estimate the Jaccard similarity of two texts from their signatures.
+    """
+    return sum(1 for left, right in zip(signature, other) if left == right) / len(signature)
+
+class SimilarityCache:
+    # Number of writes between two eviction passes
+    EVICT_INTERVAL = 256
+
+    def __init__(self, db_file, threshold=0.85, num_perm=64, bands=16, max_entries=0, max_age=0):
+        """
+        Initialize a cache returning the response of a previous text similar enough to a new one.
+        Texts are compared with MinHash signatures of their shingles, candidates are found with
+        locality sensitive hashing on bands of the signatures, then kept above the similarity threshold.
+        Entries are stored in a sqlite database and indexed in memory. max_entries and max_age (in seconds)
+        bound the size of the cache, the oldest entries are evicted first, 0 disables the limit.
+        """
+        self.db_file = db_file
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self._writes = 0
+        self.hasher = MinHasher(num_perm)
+        self.bands = bands
+        self.rows = num_perm // bands
+        self._entries = {}
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.lookups = 0
+        self.hits = 0
+        self._similarity_sum = 0.0
+        self._similarity_min = None
+
+        os.makedirs(os.path.dirname(db_file) or '.', exist_ok=True)
+        conn = self._connection()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS signatures (
+                key_hash TEXT PRIMARY KEY,
+                scope TEXT NOT NULL,
+                signature BLOB NOT NULL,
+                value TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )""")
+        self.evict()
+        for key_hash, scope, signature, value in conn.execute("SELECT key_hash, scope, signature, value FROM signatures"):
+            signature = array('I', signature)
+            if len(signature) == self.hasher.num_perm:
+                self._index(key_hash, scope, signature, value)
+
+    def _connection(self):
+        """
+        Return the sqlite connection of the current thread.
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_file, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _band_keys(self, scope, signature):
+        """
+        Return the LSH bucket keys of a signature, one per band.
+        """
+        return [(scope, band, tuple(signature[band * self.rows:(band + 1) * self.rows])) for band in range(self.bands)]
+
+    def _index(self, key_hash, scope, signature, value):
+        """
+        Add an entry to the in-memory index.
+        """
+        with self._lock:
+            self._entries[key_hash] = (scope, signature, value)
+            for band_key in self._band_keys(scope, signature):
+                self._buckets.setdefault(band_key, set()).add(key_hash)
+
+    def get(self, scope, text):
+        """
+        Return the (value, similarity) of the most similar text of the scope above the threshold, or None.
+        Texts are only compared within a scope, e.g. the provider, model and slide type.
+        """
+        signature = self.hasher.signature(text)
+        with self._lock:
+            candidates = set()
+            for band_key in self._band_keys(scope, signature):
+                candidates.update(self._buckets.get(band_key, ()))
+
+            best, best_similarity = None, 0.0
+            for key_hash in candidates:
+                _, candidate_signature, value = self._entries[key_hash]
+                score = similarity(signature, candidate_signature)
+                if score > best_similarity:
+                    best, best_similarity = value, score
+
+            self.lookups += 1
+            if best is None or best_similarity < self.threshold:
+                return None
+            self.hits += 1
+            self._similarity_sum += best_similarity
+            self._similarity_min = best_similarity if self._similarity_min is None else min(self._similarity_min, best_similarity)
+            return best, best_similarity
+
+    def set(self, scope, text, value):
+        """
+        Store the value of a text.
+        """
+        signature = self.hasher.signature(text)
+        key_hash = hashlib.sha256(f"{scope}\n{text}".encode('utf-8')).hexdigest()
+        self._connection().execute(
+            "INSERT OR REPLACE INTO signatures (key_hash, scope, signature, value, created_at) VALUES (?, ?, ?, ?, ?)",
+            (key_hash, scope, signature.tobytes(), value, time.time()))
+        self._index(key_hash, scope, signature, value)
+
+        self._writes += 1
+        if self._writes % self.EVICT_INTERVAL == 0:
+            self.evict()
+
+    def evict(self):
+        """
+        Remove the entries over the age and size limits from the database and the in-memory index.
+        Return the number of removed entries.
+        """
+        stale = stale_signatures(self._connection(), self.max_entries, self.max_age)
+        self._connection().executemany("DELETE FROM signatures WHERE key_hash = ?", [(key_hash,) for key_hash in stale])
+        with self._lock:
+            for key_hash in stale:
+                entry = self._entries.pop(key_hash, None)
+                if entry is None:
+                    continue
+                for band_key in self._band_keys(entry[0], entry[1]):
+                    bucket = self._buckets.get(band_key)
+                    if bucket is not None:
+                        bucket.discard(key_hash)
+                        if not bucket:
+                            del self._buckets[band_key]
+        return len(stale)
+
+    def stats(self):
+        """
+        Return the number of lookups and hits, the hit rate, the threshold and the similarities of the hits.
+        """
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'lookups': self.lookups,
+                'hits': self.hits,
+                'hit_rate': self.hits / self.lookups if self.lookups else 0.0,
+                'threshold': self.threshold,
+                'min_similarity': self._similarity_min,
+                'mean_similarity': self._similarity_sum / self.hits if self.hits else None,
+            }
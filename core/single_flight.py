@@ -0,0 +1,55 @@
+# single_flight.py
+from concurrent.futures import Future
+import threading
+
+class SingleFlight:
+    def __init__(self):
+        """
+        Initialize a group of calls where concurrent calls of the same key are coalesced:
+        the first caller runs the call, the others wait for it and share its result or exception.
+        """
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.coalesced = 0
+
+    def do(self, key, function, *args):
+        """
+        Run function(*args), or wait for the call of the same key already in flight.
+        Return the result and whether it was shared from another caller.
+        """
+        with self._lock:
+            future = self._flights.get(key)
+            shared = future is not None
+            if shared:
+                self.coalesced += 1
+            else:
+                future = self._flights[key] = Future()
+                self.calls += 1
+        if shared:
+            return future.result(), True
+
+        try:
+            result = function(*args)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            with self._lock:
+                del self._flights[key]
+
+    def stats(self):
+        """
+        Return the number of calls run, the number of calls coalesced into them and the coalescing rate.
+        """
+        with self._lock:
+            total = self.calls + self.coalesced
+            return {
+                'calls': self.calls,
+                'coalesced': self.coalesced,
+                'in_flight': len(self._flights),
+                'coalesced_rate': self.coalesced / total if total else 0.0,
+            }
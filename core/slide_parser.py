@@ -0,0 +1,148 @@
+# slide_parser.py
+from dataclasses import dataclass, field
+import re
+
+LAYOUT_TAGS = ('L_TS', 'L_CS', 'L_TCS', 'L_IS', 'L_THS')
+FIELD_TAGS = ('TITLE', 'SUBTITLE', 'CONTENT', 'IMAGE')
+SLIDE_BREAK = 'SLIDEBREAK'
+
+# Only the tags of the grammar are matched, other bracketed text such as '[AI]' is kept as text
+TAG_PATTERN = re.compile(r'\[(/?)(' + '|'.join((SLIDE_BREAK,) + LAYOUT_TAGS + FIELD_TAGS) + r')\]')
+# Longest tag of the grammar, a trailing '[' further away than this can not start a tag
+MAX_TAG_LENGTH = max(len(f"[/{name}]") for name in (SLIDE_BREAK,) + LAYOUT_TAGS + FIELD_TAGS)
+
+@dataclass
+class SlideRecord:
+    """
+    A slide of the outline: its layout tag (e.g. '[L_CS]'), its fields and the markup errors met while parsing it.
+    """
+    layout: str = None
+    title: str = ''
+    subtitle: str = ''
+    contents: list = field(default_factory=list)
+    image: str = ''
+    errors: list = field(default_factory=list)
+
+    def is_empty(self):
+        """
+        Check whether no tag of the slide was found.
+        """
+        return self.layout is None and not (self.title or self.subtitle or self.contents or self.image)
+
+class SlideParser:
+    def __init__(self):
+        """
+        Initialize an incremental parser of the tagged slide markup.
+        Text is given in chunks with feed() and the slides are returned as soon as they are complete.
+        """
+        self._buffer = ''
+        self._slide = SlideRecord()
+        self._open_field = None
+        self._text = []
+
+    def parse(self, text):
+        """
+        Parse a complete outline and return its slides.
+        """
+        return self.feed(text) + self.close()
+
+    def feed(self, chunk):
+        """
+        Parse a chunk of the outline and return the slides completed by it.
+        Each chunk is scanned once, only an incomplete tag at its end is kept and scanned again with the next one.
+        """
+        if '[' not in chunk and not self._buffer:
+            # No tag can start or end in the chunk, it is text only
+            if self._open_field is not None:
+                self._text.append(chunk)
+            return []
+
+        # The pattern has two groups, the parts are the texts between the tags and the groups of each tag
+        parts = TAG_PATTERN.split(self._buffer + chunk)
+        slides = []
+        for index in range(0, len(parts) - 1, 3):
+            self._add_text(parts[index])
+            self._on_tag(parts[index + 1] == '/', parts[index + 2], slides)
+
+        rest = parts[-1]
+        start = rest.rfind('[')
+        if start != -1 and ']' not in rest[start:] and len(rest) - start < MAX_TAG_LENGTH:
+            self._add_text(rest[:start])
+            self._buffer = rest[start:]
+        else:
+            self._add_text(rest)
+            self._buffer = ''
+        return slides
+
+    def close(self):
+        """
+        Signal the end of the outline and return the last slide, if any.
+        """
+        self._add_text(self._buffer)
+        self._buffer = ''
+        slides = []
+        self._end_slide(slides)
+        return slides
+
+    def _add_text(self, text):
+        """
+        Collect the text of the open field, text outside of the fields is ignored.
+        """
+        if text and self._open_field is not None:
+            self._text.append(text)
+
+    def _on_tag(self, closing, name, slides):
+        """
+        Update the current slide for a tag, recovering from missing and unexpected tags.
+        """
+        if name == SLIDE_BREAK:
+            if not closing:
+                self._end_slide(slides)
+        elif name in LAYOUT_TAGS:
+            if closing:
+                return
+            if self._slide.layout is not None:
+                self._slide.errors.append(f"missing [{SLIDE_BREAK}] before [{name}]")
+                self._end_slide(slides)
+            self._slide.layout = f"[{name}]"
+        elif not closing:
+            if self._open_field is not None:
+                self._slide.errors.append(f"missing [/{self._open_field}] before [{name}]")
+                self._close_field()
+            self._open_field = name
+            self._text = []
+        elif self._open_field == name:
+            self._close_field()
+        elif self._open_field is None:
+            self._slide.errors.append(f"unexpected [/{name}]")
+        else:
+            self._slide.errors.append(f"[/{name}] closes [{self._open_field}]")
+            self._close_field()
+
+    def _close_field(self):
+        """
+        Store the text of the open field in the current slide.
+        """
+        name, text = self._open_field, ''.join(self._text).strip()
+        self._open_field = None
+        self._text = []
+
+        if name == 'CONTENT':
+            self._slide.contents.append(text)
+        elif name == 'TITLE' and not self._slide.title:
+            self._slide.title = text
+        elif name == 'SUBTITLE' and not self._slide.subtitle:
+            self._slide.subtitle = text
+        elif name == 'IMAGE' and not self._slide.image:
+            self._slide.image = text
+
+    def _end_slide(self, slides):
+        """
+        Complete the current slide and start a new one.
+        """
+        if self._open_field is not None:
+            self._slide.errors.append(f"missing [/{self._open_field}]")
+            self._close_field()
+        if not self._slide.is_empty():
+            slides.append(self._slide)
+        self._slide = SlideRecord()
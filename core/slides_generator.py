@@ -1,128 +1,429 @@
-from pptx import Presentation
 from core.image_search import ImageSearcher
+from core.image_processor import ImageProcessor
 from core.ai_requester import AIRequester
 from core.layout_manager import LayoutManager
+from core.slide_parser import SlideParser
+from core.template_registry import TemplateRegistry
 from core.web_search import WebSearch
+from core.cache_store import CacheStore
+from core.tracing import tracer
+from core.deck_cache import DeckCache
+from core.deck_manifest import DeckCheckpoint, DeckManifest, OUTPUT_FIELDS, digest, manifest_path
+from core.deck_writer import DeckWriter
+from core.scheduler import JobContext
+from concurrent.futures import Future, ThreadPoolExecutor
+import hashlib
+import json
 import os
+import uuid
+
+# Settings changing the content of a presentation, part of its deck key, with their defaults
+OUTPUT_SETTINGS = {
+    'BATCH_SIZE': 1,
+    'WEB_SEARCH_LLM_FORMAT': True,
+    'CONTEXT_TOKEN_BUDGET': 1500,
+    'PROMPT_TOKEN_BUDGET': 0,
+    'IMAGE_PROCESSING': True,
+    'IMAGE_DPI': 150,
+    'IMAGE_QUALITY': 85,
+    'SIMILARITY_CACHE': False,
+    'SIMILARITY_THRESHOLD': 0.85,
+}
+
+class DeckJobs:
+    def __init__(self, executor, image_searcher, picture_size, previous=None, checkpoint=None, writer=None, job=None):
+        """
+        Hold the state shared by the slide requests of one deck: the worker pool, the image searcher,
+        the size of the picture placeholder, the slide texts waiting to be sent as a batch and the image statistics.
+        The outputs of the previous generation, by slide input key, are reused in incremental mode.
+        In large-deck mode, completed slides are appended to the checkpoint and images are inserted as stubs of the writer.
+        job is the JobContext of the LLM requests of the deck.
+        """
+        self.executor = executor
+        self.image_searcher = image_searcher
+        self.picture_size = picture_size
+        self.previous = previous or {}
+        self.batch = []
+        self.image_stats = {}
+        self.manifest = []
+        self.reused = 0
+        self.checkpoint = checkpoint
+        self.writer = writer
+        self.job = job
 
 class SlidesGenerator:
-    def __init__(self, config):
+    def __init__(self, config, search_backend=None):
         """
         Initialize the SlidesGenerator with the config for paths and image search settings.
+        The search backend of the web context can be replaced, DuckDuckGo is used by default.
         """
         self.config = config
         self.ai_requester = AIRequester(config)
-        self.layoutM = LayoutManager()
+        self.template_registry = TemplateRegistry(os.path.join(config['OUTPUT_PATH'], 'template_index'))
+        self.template_path = config.get('TEMPLATE', 'templates/template0.pptx')
+        self.layoutM = LayoutManager(self.template_registry.get(self.template_path))
+        self.image_searcher = ImageSearcher(config)
+        self.image_processor = ImageProcessor(config)
+        self.search_backend = search_backend
+        self.web_cache = CacheStore(os.path.join(config['OUTPUT_PATH'], 'web_cache.db'),
+                                    max_age=config.get('WEB_CACHE_TTL', 86400))
+        self.max_workers = max(1, config.get('MAX_WORKERS', 4))
+        self.streaming = config.get('STREAMING', False)
+        self.batch_size = max(1, config.get('BATCH_SIZE', 1))
+        self.incremental = config.get('INCREMENTAL', False)
+        self.large_deck = config.get('LARGE_DECK', False)
+        self.deck_cache = None
+        if config.get('DECK_CACHE', True):
+            self.deck_cache = DeckCache(os.path.join(config['OUTPUT_PATH'], 'deck_cache'), config.get('DECK_CACHE_TTL', 86400))
 
-    def generate_presentation(self, topic, slide_length):
+    def generate_presentation(self, topic, slide_length, filename=None, incremental=None, job=None, use_deck_cache=True):
         """
         Generate a PowerPoint presentation based on the AI content response.
+        The file is named after the presentation title unless a filename is given.
+
+        A manifest of the slide inputs and outputs is written next to the file. In incremental mode,
+        the texts and images of the slides whose inputs did not change since that manifest are reused.
+
+        In large-deck mode, completed slides are checkpointed and an interrupted generation of the same deck
+        resumes from them. Images stay on disk until the file is written, their payloads are streamed into it.
+
+        job is the JobContext giving the priority of the LLM requests, an interactive job of its own by default.
+
+        A presentation of the same topic, slide count, template, provider and model generated within DECK_CACHE_TTL
+        is copied from the deck cache instead. Without use_deck_cache, the presentation is generated again
+        and replaces the cached one.
         """
-        context = WebSearch(self.config, topic).perform_search_and_format(self.ai_requester)
-        prompt = self.ai_requester.create_prompt(topic, slide_length, context)
-        content = self.ai_requester.request_ai(prompt)
-        
-        presentation = Presentation("templates/template0.pptx")
-        self._parse_response(presentation, content)
+        if incremental is None:
+            incremental = self.incremental
+        job = job or JobContext(uuid.uuid4().hex)
+
+        with tracer.span('generate_presentation', topic=topic, slides=slide_length, incremental=incremental,
+                         priority=job.priority) as span:
+            deck_key = self.deck_key(topic, slide_length)
+            if self.deck_cache is not None and use_deck_cache:
+                ppt_filename = self.deck_cache.get(deck_key, self.config['OUTPUT_PATH'], filename)
+                span.set('deck_cache_hit', ppt_filename is not None)
+                if ppt_filename is not None:
+                    print(f"Deck cache hit: {ppt_filename} copied from {self.deck_cache.cache_path}")
+                    return ppt_filename
+
+            ppt_filename = self._generate_presentation(topic, slide_length, filename, incremental, job)
+            if self.deck_cache is not None:
+                self.deck_cache.set(deck_key, self.config['OUTPUT_PATH'], ppt_filename)
+            return ppt_filename
+
+    def _generate_presentation(self, topic, slide_length, filename, incremental, job):
+        """
+        Run the stages of the generation: web context, outline, slides and save.
+        """
+        # Search the web context while the template is loaded
+        web_search = WebSearch(self.config, topic, backend=self.search_backend, cache=self.web_cache)
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            context_future = executor.submit(web_search.perform_search_and_format, self.ai_requester, job)
+            presentation = self._load_template()
+            context = context_future.result()
+        prompt, prompt_stats = self.ai_requester.create_outline_prompt(topic, slide_length, context)
+        print(f"Outline prompt: {prompt_stats['prompt_tokens']} tokens, {prompt_stats['saved_tokens']} context tokens "
+              f"trimmed ({prompt_stats['kept_snippets']} of {prompt_stats['snippets']} snippets kept)")
+
+        previous = {}
+        if incremental:
+            previous = self._load_previous_outputs(presentation, topic, filename)
+        checkpoint, writer = None, None
+        if self.large_deck:
+            checkpoint = DeckCheckpoint(os.path.join(self.config['OUTPUT_PATH'], 'checkpoints',
+                                                     f"{self.deck_key(topic, slide_length)}.jsonl"))
+            resumed = checkpoint.load()
+            if resumed:
+                print(f"Resuming {len(resumed)} completed slides from {checkpoint.path}")
+            previous = {**previous, **resumed}
+            writer = DeckWriter()
+
+        if not self.streaming:
+            with tracer.span('outline'):
+                content = self.ai_requester.request_ai(prompt, role='outline', job=job)
+        with tracer.span('slides', streaming=self.streaming) as span:
+            if self.streaming:
+                jobs = self._parse_stream(presentation, self.ai_requester.stream_ai(prompt, role='outline', job=job),
+                                          previous, checkpoint, writer, job)
+            else:
+                jobs = self._parse_response(presentation, content, previous, checkpoint, writer, job)
+            span.set('count', len(jobs.manifest))
+            span.set('reused', jobs.reused)
+        if incremental:
+            print(f"Reused {jobs.reused} of {len(jobs.manifest)} slides from the previous manifest")
+
         title = self._get_presentation_title(presentation) or topic
-        ppt_filename = f"{title}.pptx"
-        presentation.save(f"{self.config['OUTPUT_PATH']}/{ppt_filename}")
+        ppt_filename = filename or f"{title}.pptx"
+        output_file = f"{self.config['OUTPUT_PATH']}/{ppt_filename}"
+        with tracer.span('save', file=ppt_filename, large_deck=self.large_deck):
+            if writer is not None:
+                writer.save(presentation, output_file)
+            else:
+                presentation.save(output_file)
+        DeckManifest(manifest_path(output_file)).save(
+            self.deck_key(topic, slide_length), topic, slide_length, self._get_template().digest, jobs.manifest)
+        if checkpoint is not None:
+            checkpoint.remove()
         return ppt_filename
 
-    def _parse_response(self, presentation, content):
+    def deck_cache_stats(self):
+        """
+        Return the lookups, hits and hit rate of the deck cache, or None when it is disabled.
+        """
+        return self.deck_cache.stats() if self.deck_cache is not None else None
+
+    def deck_key(self, topic, slide_length):
+        """
+        Return a key identifying the inputs of a presentation: topic, slide count, template, provider and model,
+        or backends when the requests are routed, and the settings changing its content.
+        """
+        inputs = {
+            'topic': ' '.join(topic.lower().split()),
+            'slides': slide_length,
+            'template': self._get_template().digest,
+            'provider': self.config['PROVIDER'],
+            'model': self.config.get('MODEL'),
+            'settings': {name: self.config.get(name, default) for name, default in OUTPUT_SETTINGS.items()},
+        }
+        if self.config.get('BACKENDS'):
+            # The routed backends replace the provider and model
+            inputs['backends'] = self.config['BACKENDS']
+        return hashlib.sha256(json.dumps(inputs, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def _get_template(self):
+        """
+        Get the parsed template, the registry parses it again only if the file changed.
+        """
+        template = self.template_registry.get(self.template_path)
+        self.layoutM.template = template
+        return template
+
+    def _load_template(self):
+        """
+        Create a new presentation cloned from the parsed template.
+        """
+        with tracer.span('load_template'):
+            return self._get_template().new_presentation()
+
+    def _load_previous_outputs(self, presentation, topic, filename):
+        """
+        Return the slide outputs of the manifest of the previous generation, by slide input key.
+        """
+        if filename is None:
+            # The template has no slide, the presentation is named after the title of its outline
+            if not len(presentation.slides):
+                print("Incremental mode needs a filename when the template has no slide.")
+                return {}
+            filename = f"{self._get_presentation_title(presentation) or topic}.pptx"
+        manifest = DeckManifest(manifest_path(f"{self.config['OUTPUT_PATH']}/{filename}"))
+        if not manifest.load():
+            return {}
+        return manifest.slide_outputs()
+
+    def _parse_response(self, presentation, content, previous=None, checkpoint=None, writer=None, job=None):
         """
         Parse the response from the AI model and create slides in the PowerPoint presentation.
         """
-        slides = content.split("[SLIDEBREAK]")
-        for slide in slides:
+        return self._parse_stream(presentation, [content], previous, checkpoint, writer, job)
+
+    def _parse_stream(self, presentation, chunks, previous=None, checkpoint=None, writer=None, job=None):
+        """
+        Parse the response from the AI model, given as text chunks, and create slides in the PowerPoint presentation.
+        Return the deck jobs, holding the manifest entries of the slides.
+
+        Each slide is submitted to a bounded worker pool for its texts and image as soon as its
+        [SLIDEBREAK] arrives, slides are added to the presentation in their original order.
+        """
+        parser = SlideParser()
+        specs = []
+        rendered = 0
 
-            slide_type = self._find_slide_type(slide)
-            title = self._extract_tag_content(slide, "[TITLE]", "[/TITLE]") or "Untitled"
-            
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            jobs = DeckJobs(executor, self.image_searcher, self.layoutM._get_picture_size(presentation), previous,
+                            checkpoint, writer, job)
+            for chunk in chunks:
+                for slide in parser.feed(chunk):
+                    specs.append(self._prepare_slide(jobs, slide))
 
-            if slide_type == "[L_TS]":  # Title Slide
-                subtitle = self._extract_tag_content(slide, "[SUBTITLE]", "[/SUBTITLE]") 
-                self.layoutM._create_title_slide(presentation, title, subtitle)
-            elif slide_type == "[L_CS]":  # Content Slide
-                context = self._extract_tag_content(slide, "[CONTENT]", "[/CONTENT]")
-                prompt =  self.ai_requester.create_slide_prompt(slide_type, title, context)
-                text_content =  self.ai_requester.request_ai(prompt)
+                # Render the slides that are already complete while the response is still streaming
+                while rendered < len(specs) and self._is_slide_ready(specs[rendered]):
+                    self._render_slide(presentation, specs[rendered], jobs)
+                    rendered += 1
 
-                self.layoutM._create_title_and_content_slide(presentation, title, text_content)
-            elif slide_type == "[L_IS]":  # Image Slide
-                context = self._extract_tag_content(slide, "[CONTENT]", "[/CONTENT]")
-                prompt = self.ai_requester.create_slide_prompt(slide_type, title, context)
-                text_content =  self.ai_requester.request_ai(prompt)
+            for slide in parser.close():
+                specs.append(self._prepare_slide(jobs, slide))
+            self._flush_batch(jobs)
+            for spec in specs[rendered:]:
+                self._render_slide(presentation, spec, jobs)
 
+        if jobs.image_stats:
+            stats = jobs.image_stats
+            print(f"Processed {stats['images']} images: {stats['original_bytes']} bytes to {stats['processed_bytes']} bytes, "
+                  f"{stats['original_bytes'] - stats['processed_bytes']} bytes saved")
+        return jobs
 
-                image_query = self._extract_tag_content(slide, "[IMAGE]", "[/IMAGE]")
-                image_searcher = ImageSearcher(self.config)
-                image_path = image_searcher.download_image(title)
-        
-                self.layoutM._create_picture_with_caption_slide(presentation, title, 
-                    os.path.join(self.config["IMAGES_PATH"], image_path),
-                    text_content)
-            elif slide_type == "[L_TCS]":  # Two Content Slide
-                contents = self._extract_all_tag_content(slide, "[CONTENT]", "[/CONTENT]")
-                if len(contents) < 2:
-                    continue
-                content_left = contents[0]
-                content_right = contents[1]
+    def _prepare_slide(self, jobs, slide):
+        """
+        Submit the AI requests and image download of a parsed slide to the worker pool.
+        """
+        slide_type = slide.layout
+        title = slide.title or "Untitled"
+        spec = {'type': slide_type, 'title': title}
+        if slide.errors:
+            print(f"Malformed slide {title}: {', '.join(slide.errors)}")
 
-                prompt_left =  self.ai_requester.create_slide_prompt(slide_type, title, content_left)
-                text_content_left =  self.ai_requester.request_ai(prompt_left)
+        texts = {}
+        image_query = None
+        if slide_type == "[L_TS]":  # Title Slide
+            spec['subtitle'] = slide.subtitle
+        elif slide_type == "[L_CS]":  # Content Slide
+            texts['content'] = slide.contents[0] if slide.contents else ""
+        elif slide_type == "[L_IS]":  # Image Slide
+            texts['content'] = slide.contents[0] if slide.contents else ""
+            image_query = title
+        elif slide_type == "[L_TCS]":  # Two Content Slide
+            if len(slide.contents) < 2:
+                return None
+            texts['content_left'] = slide.contents[0]
+            texts['content_right'] = slide.contents[1]
 
-                prompt_right =  self.ai_requester.create_slide_prompt(slide_type, title, content_right)
-                text_content_right =  self.ai_requester.request_ai(prompt_right)
+        spec['inputs'] = self._slide_inputs(jobs, slide, slide_type, title, texts, image_query)
+        outputs = jobs.previous.get(spec['inputs']['key'])
+        if outputs is not None and all(field in outputs for field in texts) and (image_query is None or 'image' in outputs):
+            # The inputs of the slide did not change, reuse its previous texts and image
+            for field in texts:
+                spec[field] = self._completed(outputs[field])
+            if image_query is not None:
+                spec['image'] = self._completed(outputs['image'])
+            jobs.reused += 1
+            return spec
 
-                self.layoutM._create_two_content_slide(presentation, title, text_content_left, text_content_right)
-            elif slide_type == "[L_THS]":  # Thanks Slide
-                self.layoutM._create_title_only_slide(presentation, title)
+        for field, context in texts.items():
+            spec[field] = self._submit_slide_text(jobs, slide_type, title, context)
+        if image_query is not None:
+            spec['image'] = jobs.image_searcher.executor.submit(self._fetch_image, jobs, image_query)
+        return spec
 
-    
-    def _extract_all_tag_content(self, text, start_tag, end_tag):
+    def _slide_inputs(self, jobs, slide, slide_type, title, texts, image_query):
         """
-        Extract all occurrences of content between the custom start and end tags in the given text.
+        Hash the inputs of a slide: its outline section, its text prompts and the models answering them,
+        its image query and the template.
+        The key combining them identifies the slide in the manifest.
         """
-        contents = []
-        start = 0
+        section = [slide.layout, slide.title, slide.subtitle, slide.contents, slide.image]
+        prompts = [self.ai_requester.create_slide_prompt(slide_type, title, context) for context in texts.values()]
+        inputs = {
+            'section': digest(section),
+            'prompt': digest([prompts, self.ai_requester.backend.identity('expansion')]),
+            'image_query': digest([image_query, jobs.picture_size, self.image_processor.enabled,
+                                   self.image_processor.dpi, self.image_processor.quality]) if image_query else None,
+            'template': self._get_template().digest,
+        }
+        inputs['key'] = digest(inputs)
+        return inputs
 
-        while True:
-            start = text.find(start_tag, start)
-            if start == -1:  # No more tags
-                break
-            end = text.find(end_tag, start + len(start_tag))
-            if end == -1:  # End tag not found
-                break
+    def _completed(self, value):
+        """
+        Return a future already resolved with a value.
+        """
+        future = Future()
+        future.set_result(value)
+        return future
 
-            # Extract content and add to list
-            content = text[start + len(start_tag):end].strip()
-            contents.append(content)
+    def _submit_slide_text(self, jobs, slide_type, title, content):
+        """
+        Submit the AI request generating the text of a slide and return its future.
+        When batching is enabled, the request is queued until the batch is full.
+        """
+        if self.batch_size == 1:
+            return jobs.executor.submit(self.ai_requester.request_slide, slide_type, title, content, jobs.job)
 
-            # Move start position beyond the current tag
-            start = end + len(end_tag)
+        future = Future()
+        jobs.batch.append(((slide_type, title, content), future))
+        if len(jobs.batch) >= self.batch_size:
+            self._flush_batch(jobs)
+        return future
 
-        return contents
+    def _flush_batch(self, jobs):
+        """
+        Submit the queued slide texts as a single batch request.
+        """
+        if not jobs.batch:
+            return
+        batch, jobs.batch = jobs.batch, []
+        jobs.executor.submit(self._request_batch, batch, jobs.job)
 
+    def _request_batch(self, batch, job=None):
+        """
+        Request the texts of a batch of slides and resolve their futures.
+        """
+        try:
+            texts = self.ai_requester.request_ai_batch([slide for slide, _ in batch], job)
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        for (_, future), text in zip(batch, texts):
+            future.set_result(text)
+
+    def _fetch_image(self, jobs, query):
+        """
+        Download the image of a slide and resize it for the picture placeholder, return its path.
+        """
+        image_file = jobs.image_searcher.download_image(query)
+        image_path = os.path.join(self.config["IMAGES_PATH"], image_file)
+        return self.image_processor.prepare(image_path, *jobs.picture_size, stats=jobs.image_stats)
 
-    def _extract_tag_content(self, text, start_tag, end_tag):
+    def _is_slide_ready(self, spec):
         """
-        Extract the content between the start and end tags in the given text.
+        Check whether all the requests of a slide are complete.
         """
-        start = text.find(start_tag)
-        end = text.find(end_tag)
-        if start != -1 and end != -1:
-            return text[start + len(start_tag):end].strip()
-        return ""
+        if spec is None:
+            return True
+        return all(value.done() for value in spec.values() if isinstance(value, Future))
 
-    def _find_slide_type(self, text):
+    def _render_slide(self, presentation, spec, jobs):
         """
-        Find the slide type tag in the given text.
+        Wait for the slide requests to complete and add the slide to the presentation.
+        Its inputs and outputs are added to the manifest entries of the deck jobs.
         """
-        for tag in ["[L_TS]", "[L_CS]", "[L_IS]", "[L_THS]", "[L_TCS]"]:
-            if tag in text:
-                return tag
-        return None
+        if spec is None:
+            return
+
+        with tracer.span('render_slide', layout=spec['type']):
+            self._add_slide(presentation, spec, jobs)
+
+    def _add_slide(self, presentation, spec, jobs):
+        """
+        Add the slide of a completed spec to the presentation and its entry to the manifest.
+        """
+        slide_type = spec['type']
+        title = spec['title']
+
+        if slide_type == "[L_TS]":  # Title Slide
+            self.layoutM._create_title_slide(presentation, title, spec['subtitle'])
+        elif slide_type == "[L_CS]":  # Content Slide
+            self.layoutM._create_title_and_content_slide(presentation, title, spec['content'].result())
+        elif slide_type == "[L_IS]":  # Image Slide
+            text_content = spec['content'].result()
+            picture = spec['image'].result()
+            if jobs.writer is not None:
+                picture = jobs.writer.image_stub(picture)
+            self.layoutM._create_picture_with_caption_slide(presentation, title, picture, text_content)
+        elif slide_type == "[L_TCS]":  # Two Content Slide
+            self.layoutM._create_two_content_slide(presentation, title,
+                spec['content_left'].result(), spec['content_right'].result())
+        elif slide_type == "[L_THS]":  # Thanks Slide
+            self.layoutM._create_title_only_slide(presentation, title)
+
+        outputs = {field: spec[field].result() if isinstance(spec[field], Future) else spec[field]
+                   for field in OUTPUT_FIELDS if field in spec}
+        inputs = dict(spec['inputs'])
+        jobs.manifest.append({'key': inputs.pop('key'), 'layout': slide_type, 'title': title,
+                              'inputs': inputs, 'outputs': outputs})
+        if jobs.checkpoint is not None:
+            jobs.checkpoint.append(jobs.manifest[-1])
 
     def _get_presentation_title(self, presentation):
         """
@@ -0,0 +1,162 @@
+# template_registry.py
+import copy
+import hashlib
+import io
+import json
+import os
+import threading
+
+# Placeholder types that do not hold slide content
+DECORATION_TYPES = ('TITLE', 'CENTER_TITLE', 'VERTICAL_TITLE', 'DATE', 'FOOTER', 'SLIDE_NUMBER')
+
+# Role: (layout name, index in the default template, content placeholder types)
+LAYOUT_ROLES = {
+    'title': ('Title Slide', 0, ['SUBTITLE']),
+    'title_and_content': ('Title and Content', 1, ['OBJECT']),
+    'section_header': ('Section Header', 2, ['BODY']),
+    'two_content': ('Two Content', 3, ['OBJECT', 'OBJECT']),
+    'comparison': ('Comparison', 4, ['BODY', 'BODY', 'OBJECT', 'OBJECT']),
+    'title_only': ('Title Only', 5, []),
+    'blank': ('Blank', 6, []),
+    'content_with_caption': ('Content with Caption', 7, ['BODY', 'OBJECT']),
+    'picture_with_caption': ('Picture with Caption', 8, ['BODY', 'PICTURE']),
+    'title_and_vertical_text': ('Title and Vertical Text', 9, ['BODY']),
+    'vertical_title_and_text': ('Vertical Title and Text', 10, ['BODY']),
+}
+
+class Template:
+    def __init__(self, path, content, index, presentation):
+        """
+        Hold a parsed template: its content hash, its layout index and a pristine presentation to clone.
+        """
+        self.path = path
+        self.digest = hashlib.sha256(content).hexdigest()
+        self.layouts = index['layouts']
+        self.roles = index['roles']
+        self._pristine = presentation
+
+    def new_presentation(self):
+        """
+        Return a new presentation cloned from the parsed template.
+        """
+        return copy.deepcopy(self._pristine)
+
+    def layout_index(self, role):
+        """
+        Return the index of the slide layout of a role, e.g. 'two_content'.
+        """
+        return self.roles[role]
+
+    def content_placeholders(self, role):
+        """
+        Return the placeholders (idx, type, width, height) holding the content of a role's layout, ordered by idx.
+        """
+        layout = self.layouts[self.roles[role]]
+        return [placeholder for placeholder in layout['placeholders'] if placeholder['type'] not in DECORATION_TYPES]
+
+class TemplateRegistry:
+    def __init__(self, index_path=None):
+        """
+        Initialize the registry parsing each template once per process.
+        Layout indexes are also saved as JSON files in index_path, keyed by the template hash.
+        """
+        self.index_path = index_path
+        self._templates = {}
+        self._lock = threading.Lock()
+
+    def get(self, template_path):
+        """
+        Return the parsed template, it is parsed again only if the file changed.
+        """
+        stat = os.stat(template_path)
+        key = (os.path.abspath(template_path), stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            template = self._templates.get(key)
+            if template is None:
+                template = self._load(template_path)
+                self._templates[key] = template
+            return template
+
+    def _load(self, template_path):
+        """
+        Parse a template and load or build its layout index.
+        """
+        from pptx import Presentation
+
+        with open(template_path, 'rb') as f:
+            content = f.read()
+        presentation = Presentation(io.BytesIO(content))
+        digest = hashlib.sha256(content).hexdigest()
+
+        index = self._read_index(digest)
+        if index is None:
+            index = build_layout_index(presentation)
+            self._write_index(digest, index)
+        return Template(template_path, content, index, presentation)
+
+    def _read_index(self, digest):
+        """
+        Read the layout index saved for the template hash, or return None.
+        """
+        if not self.index_path:
+            return None
+        index_file = os.path.join(self.index_path, f"{digest}.json")
+        if os.path.exists(index_file):
+            try:
+                with open(index_file, 'r') as f:
+                    return json.load(f)
+            except json.JSONDecodeError:
+                print(f"Layout index {index_file} is corrupted, rebuilding it.")
+        return None
+
+    def _write_index(self, digest, index):
+        """
+        Save the layout index of the template hash.
+        """
+        if not self.index_path:
+            return
+        os.makedirs(self.index_path, exist_ok=True)
+        index_file = os.path.join(self.index_path, f"{digest}.json")
+        with open(index_file + '.tmp', 'w') as f:
+            json.dump(index, f, indent=4)
+        os.replace(index_file + '.tmp', index_file)
+
+def build_layout_index(presentation):
+    """
+    List the layouts of a presentation with their placeholders, and resolve the layout of each role
+    by layout name, then by content placeholder types, then by its index in the default template.
+    """
+    layouts = []
+    for layout_index, layout in enumerate(presentation.slide_layouts):
+        placeholders = [
+            {
+                'idx': placeholder.placeholder_format.idx,
+                'name': placeholder.name,
+                'type': placeholder.placeholder_format.type.name if placeholder.placeholder_format.type else None,
+                'width': placeholder.width,
+                'height': placeholder.height,
+            }
+            for placeholder in layout.placeholders
+        ]
+        layouts.append({
+            'index': layout_index,
+            'name': layout.name,
+            'placeholders': sorted(placeholders, key=lambda placeholder: placeholder['idx']),
+        })
+
+    roles = {}
+    for role, (name, default_index, content_types) in LAYOUT_ROLES.items():
+        by_name = [layout['index'] for layout in layouts if layout['name'].lower() == name.lower()]
+        by_types = [
+            layout['index'] for layout in layouts
+            if sorted(placeholder['type'] for placeholder in layout['placeholders']
+                      if placeholder['type'] not in DECORATION_TYPES) == sorted(content_types)
+        ]
+        if by_name:
+            roles[role] = by_name[0]
+        elif by_types:
+            roles[role] = by_types[0]
+        elif default_index < len(layouts):
+            roles[role] = default_index
+
+    return {'layouts': layouts, 'roles': roles}
@@ -0,0 +1,198 @@
+# tracing.py
+from collections import deque
+import json
+import os
+import threading
+import time
+
+# Upper bounds in seconds of the span duration histogram buckets
+DURATION_BUCKETS = (0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+METRIC_PREFIX = 'slides_ai'
+
+def estimate_tokens(text):
+    """
+    Estimate the number of tokens of a text, about 4 characters per token for English.
+    """
+    return (len(text) + 3) // 4 if text else 0
+
+class NullSpan:
+    """
+    Span returned while tracing is disabled, all its methods do nothing.
+    """
+    recording = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+    def set(self, key, value):
+        """
+        Ignore the attribute.
+        """
+
+NULL_SPAN = NullSpan()
+
+class Span:
+    """
+    A timed operation of the pipeline with its attributes, e.g. cache_hit, prompt_tokens or bytes.
+    """
+    recording = True
+
+    def __init__(self, tracer, name, attributes):
+        self.tracer = tracer
+        self.name = name
+        self.attributes = attributes
+        self.start = None
+        self.duration = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.duration = time.perf_counter() - self.start
+        # A generator closed early exits with GeneratorExit, which is not an error
+        if exc_type is not None and issubclass(exc_type, Exception):
+            self.attributes['error'] = exc_type.__name__
+        self.tracer._finish(self)
+        return False
+
+    def set(self, key, value):
+        """
+        Set an attribute of the span.
+        """
+        self.attributes[key] = value
+
+class Tracer:
+    def __init__(self, enabled=False, max_events=100000):
+        """
+        Initialize the tracer recording the spans of the pipeline and aggregating them into metrics.
+        While disabled, span() returns a shared span doing nothing.
+        The last max_events spans are kept for the Chrome trace export.
+        """
+        self.enabled = enabled
+        self._events = deque(maxlen=max_events)
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter()
+        self._durations = {}
+        self._counters = {}
+
+    def configure(self, config):
+        """
+        Enable or disable the tracer from the TRACING and TRACE_MAX_EVENTS settings.
+        """
+        self.enabled = config.get('TRACING', False)
+        max_events = config.get('TRACE_MAX_EVENTS', 100000)
+        if max_events != self._events.maxlen:
+            with self._lock:
+                self._events = deque(self._events, maxlen=max_events)
+        return self
+
+    def span(self, name, **attributes):
+        """
+        Return a span timing the block it is used in, e.g. `with tracer.span('image_download', query=query):`.
+        """
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, name, attributes)
+
+    def reset(self):
+        """
+        Drop the recorded spans and metrics.
+        """
+        with self._lock:
+            self._events.clear()
+            self._durations = {}
+            self._counters = {}
+
+    def _finish(self, span):
+        """
+        Record a finished span and update the metrics of its name.
+        """
+        event = {
+            'name': span.name,
+            'cat': 'pipeline',
+            'ph': 'X',
+            'ts': round((span.start - self._origin) * 1e6, 1),
+            'dur': round(span.duration * 1e6, 1),
+            'pid': os.getpid(),
+            'tid': threading.get_ident(),
+            'args': span.attributes,
+        }
+        with self._lock:
+            self._events.append(event)
+
+            histogram = self._durations.get(span.name)
+            if histogram is None:
+                histogram = self._durations[span.name] = {'buckets': [0] * len(DURATION_BUCKETS), 'count': 0, 'sum': 0.0}
+            histogram['count'] += 1
+            histogram['sum'] += span.duration
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if span.duration <= bound:
+                    histogram['buckets'][i] += 1
+
+            cache_hit = span.attributes.get('cache_hit')
+            if cache_hit is not None:
+                self._add('cache_hits_total' if cache_hit else 'cache_misses_total', span.name, 1)
+            for attribute in ('prompt_tokens', 'response_tokens'):
+                if span.attributes.get(attribute):
+                    self._add('tokens_total', span.name, span.attributes[attribute], kind=attribute[:-len('_tokens')])
+            if span.attributes.get('bytes'):
+                self._add('downloaded_bytes_total', span.name, span.attributes['bytes'])
+            if span.attributes.get('coalesced'):
+                self._add('coalesced_total', span.name, 1)
+            if 'error' in span.attributes:
+                self._add('errors_total', span.name, 1)
+
+    def _add(self, metric, span_name, value, **labels):
+        """
+        Add a value to a counter, the lock must be held.
+        """
+        key = (metric, span_name) + tuple(sorted(labels.items()))
+        self._counters[key] = self._counters.get(key, 0) + value
+
+    def chrome_trace(self):
+        """
+        Return the recorded spans in the Chrome trace event format, to open in chrome://tracing or Perfetto.
+        """
+        with self._lock:
+            events = list(self._events)
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def write_chrome_trace(self, path):
+        """
+        Write the recorded spans to a Chrome trace JSON file.
+        """
+        with open(path + '.tmp', 'w') as f:
+            json.dump(self.chrome_trace(), f, default=str)
+        os.replace(path + '.tmp', path)
+
+    def prometheus(self):
+        """
+        Return the metrics in the Prometheus text exposition format.
+        """
+        with self._lock:
+            durations = {name: dict(histogram, buckets=list(histogram['buckets']))
+                         for name, histogram in self._durations.items()}
+            counters = dict(self._counters)
+
+        lines = [f"# HELP {METRIC_PREFIX}_span_duration_seconds Duration of the pipeline spans.",
+                 f"# TYPE {METRIC_PREFIX}_span_duration_seconds histogram"]
+        for name, histogram in sorted(durations.items()):
+            for bound, count in zip(DURATION_BUCKETS, histogram['buckets']):
+                lines.append(f'{METRIC_PREFIX}_span_duration_seconds_bucket{{span="{name}",le="{bound}"}} {count}')
+            lines.append(f'{METRIC_PREFIX}_span_duration_seconds_bucket{{span="{name}",le="+Inf"}} {histogram["count"]}')
+            lines.append(f'{METRIC_PREFIX}_span_duration_seconds_sum{{span="{name}"}} {histogram["sum"]:.6f}')
+            lines.append(f'{METRIC_PREFIX}_span_duration_seconds_count{{span="{name}"}} {histogram["count"]}')
+
+        for metric in sorted({key[0] for key in counters}):
+            lines.append(f"# TYPE {METRIC_PREFIX}_{metric} counter")
+            for key, value in sorted((key, value) for key, value in counters.items() if key[0] == metric):
+                labels = ','.join([f'span="{key[1]}"'] + [f'{label}="{label_value}"' for label, label_value in key[2:]])
+                lines.append(f"{METRIC_PREFIX}_{metric}{{{labels}}} {value}")
+        return "\n".join(lines) + "\n"
+
+# Tracer shared by the pipeline, enabled with the TRACING setting
+tracer = Tracer()
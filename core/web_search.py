@@ -1,31 +1,53 @@
 # web_search.py
-from duckduckgo_search import DDGS
-from bs4 import BeautifulSoup
+from core.tracing import tracer
+
+class DuckDuckGoBackend:
+    def search(self, query, max_results):
+        """
+        Performs a DuckDuckGo search and returns the raw results.
+        """
+        from duckduckgo_search import DDGS
+
+        return DDGS().text(query, max_results=max_results)
 
 class WebSearch:
-    def __init__(self, config, query, max_results=5):
+    def __init__(self, config, query, max_results=5, backend=None, cache=None):
         """
         Initializes the WebSearch with a query and maximum number of results.
+        The backend performs the search (DuckDuckGo by default) and the optional cache
+        stores the formatted context of each query.
         """
         self.query = query
         self.max_results = max_results
         self.config = config
+        self.backend = backend or DuckDuckGoBackend()
+        self.cache = cache
+        self.llm_format = config.get('WEB_SEARCH_LLM_FORMAT', True)
 
     def search(self):
         """
-        Performs a DuckDuckGo search and returns the raw results.
+        Performs the search and returns the raw results.
         """
         try:
-            results = DDGS().text(self.query, max_results=self.max_results)
+            results = self.backend.search(self.query, self.max_results)
             return results
         except Exception as e:
             print(f"Error while searching: {e}")
             return []
 
+    def cache_key(self):
+        """
+        Returns the cache key of the query, normalized for case and whitespace.
+        """
+        mode = 'llm' if self.llm_format else 'markdown'
+        return f"{mode}:{self.max_results}:{' '.join(self.query.lower().split())}"
+
     def parse_results(self, results):
         """
         Parses the search results and returns them in a markdown format.
         """
+        from bs4 import BeautifulSoup
+
         markdown_results = []
         for result in results:
             title = result.get('title', 'No title')
@@ -42,32 +64,53 @@ class WebSearch:
 
         return "\n---\n".join(markdown_results)
 
-    def format_with_llm(self, ai_requester, markdown_results):
+    def format_with_llm(self, ai_requester, markdown_results, job=None):
         """
-        Uses ai_requester to format the results via LLM.
+        Uses ai_requester to format the results via LLM, returns None when the request fails.
         """
         try:
-            formatted_response = ai_requester.request_ai("Format the following results in proper markdown:\n" + markdown_results)
+            formatted_response = ai_requester.request_ai("Format the following results in proper markdown:\n" + markdown_results,
+                                                         job=job)
 
             return formatted_response
         except Exception as e:
             print(f"Error while formatting with LLM: {e}")
-            return markdown_results
+            return None
 
-    def perform_search_and_format(self, ai_requester):
+    def perform_search_and_format(self, ai_requester, job=None):
         """
         Performs the entire flow: search, parse, and format using LLM.
+        job is the JobContext of the LLM request.
         """
-        # Step 1: Perform search
-        results = self.search()
-        
-        if not results:
-            return "No results found."
+        with tracer.span('web_search', query=self.query, llm_format=self.llm_format) as span:
+            # Step 0: Reuse the context of a recent identical query
+            if self.cache is not None:
+                cached_results = self.cache.get(self.cache_key())
+                span.set('cache_hit', bool(cached_results))
+                if cached_results:
+                    return cached_results
+
+            # Step 1: Perform search
+            results = self.search()
+            span.set('results', len(results))
+
+            if not results:
+                return "No results found."
+
+            # Step 2: Parse results into markdown
+            markdown_results = self.parse_results(results)
 
-        # Step 2: Parse results into markdown
-        markdown_results = self.parse_results(results)
+            # Step 3: Format results with LLM, unless the markdown is used as is
+            if self.llm_format:
+                formatted_results = self.format_with_llm(ai_requester, markdown_results, job)
+                if formatted_results is None:
+                    # Use the markdown this time, without caching it, the next search tries the LLM again
+                    span.set('llm_format_failed', True)
+                    return markdown_results
+            else:
+                formatted_results = markdown_results
 
-        # Step 3: Format results with LLM
-        formatted_results = self.format_with_llm(ai_requester, markdown_results)
+            if self.cache is not None:
+                self.cache.set(self.cache_key(), formatted_results)
 
-        return formatted_results
\ No newline at end of file
+            return formatted_results
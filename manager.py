@@ -1,15 +1,33 @@
 import argparse
-from core.slides_generator import SlidesGenerator
 from config import load_config
 
 def main():
     parser = argparse.ArgumentParser(description="Generate PowerPoint presentations using AI.")
     
-    parser.add_argument("--topic", type=str, required=True, help="Topic of the presentation")
-    parser.add_argument("--slides", type=int, required=True, help="Number of slides")
+    parser.add_argument("--topic", type=str, help="Topic of the presentation")
+    parser.add_argument("--slides", type=int, help="Number of slides")
     parser.add_argument("--api_key", type=str, help="API key for the provider")
+    parser.add_argument("--serve", action="store_true", help="Run a presentation service instead of a single generation")
+    parser.add_argument("--host", type=str, default="127.0.0.1", help="Address of the service")
+    parser.add_argument("--port", type=int, default=8080, help="Port of the service")
+    parser.add_argument("--batch", type=str, help="CSV or JSONL file listing the topics and slide counts of many presentations")
+    parser.add_argument("--processes", type=int, default=4, help="Number of processes generating the batch")
+    parser.add_argument("--report", type=str, help="Path of the batch report (default OUTPUT_PATH/batch_report.json)")
+    parser.add_argument("--force", action="store_true", help="Regenerate the batch presentations that are up to date")
+    parser.add_argument("--incremental", action="store_true", help="Reuse the slides whose inputs did not change since the last generation")
+    parser.add_argument("--no-deck-cache", action="store_true", help="Generate the presentation again even if the deck cache holds it, and replace the cached one")
+    parser.add_argument("--large-deck", action="store_true", help="Checkpoint the slides, resume an interrupted generation and keep the images on disk until the file is written")
+    parser.add_argument("--trace", type=str, help="Write a Chrome trace of the generation to this file")
+    parser.add_argument("--maintenance", action="store_true", help="Report the cache usage, evict and compact the caches and remove the unused image files")
+    parser.add_argument("--dry-run", action="store_true", help="With --maintenance, report what would be removed without removing it")
+    parser.add_argument("--compact", action="store_true", help="With --maintenance, also rebuild the cache databases to shrink their files, only while no presentation is generated")
     
     args = parser.parse_args()
+    if not (args.serve or args.batch or args.maintenance) and (args.topic is None or args.slides is None):
+        parser.error("--topic and --slides are required unless --serve, --batch or --maintenance is given")
+
+    # The pipeline modules are imported once the arguments are valid, --help stays fast
+    from core.tracing import tracer
 
     # Load configuration from .env
     config = load_config()
@@ -17,11 +35,106 @@ def main():
     # Override API key if provided
     if args.api_key:
         config['API_KEY'] = args.api_key
+    if args.incremental:
+        config['INCREMENTAL'] = True
+    if args.large_deck:
+        config['LARGE_DECK'] = True
+    if args.trace:
+        config['TRACING'] = True
+        config['TRACE_FILE'] = args.trace
+    tracer.configure(config)
+
+    # Reclaim the space of the caches and image files, safe while other processes generate unless --compact is given
+    if args.maintenance:
+        from core.maintenance import StoreMaintenance
+        maintenance = StoreMaintenance(config)
+        print_storage(maintenance.stats())
+        report = maintenance.run(dry_run=args.dry_run, compact=args.compact)
+        action = "Would remove" if args.dry_run else "Removed"
+        evicted = ', '.join(f"{count} {name}" for name, count in report['evicted'].items())
+        files = ', '.join(f"{count} {kind}" for kind, count in report['removed_files'].items())
+        print(f"{action} cache entries: {evicted}")
+        print(f"{action} image files: {files} ({report['reclaimed_bytes']} bytes), "
+              f"{report['relinked']} duplicates re-pointed")
+        if args.compact and not args.dry_run:
+            print(f"Compaction reclaimed {report['compacted_bytes']} bytes")
+            print_storage(maintenance.stats())
+        return
     
-    # Generate PPT
+    # Generate many presentations in parallel processes
+    if args.batch:
+        from core.batch_runner import BatchRunner
+        try:
+            report = BatchRunner(config, args.processes, args.force, not args.no_deck_cache).run(args.batch, args.report)
+        except ValueError as e:
+            parser.error(str(e))
+        summary = report['summary']
+        print(f"Batch finished in {summary['wall_seconds']:.1f}s: {summary['done']} generated, "
+              f"{summary['skipped']} up to date, {summary['failed']} failed")
+        print(f"Deck cache: {summary['deck_cache_hits']} of {summary['done']} decks served from the cache "
+              f"({summary['deck_cache_hit_rate']:.0%})")
+        return
+
+    from core.slides_generator import SlidesGenerator
     generator = SlidesGenerator(config)
-    ppt_file = generator.generate_presentation(args.topic, args.slides)
+
+    # Keep the generator loaded and serve jobs over HTTP
+    if args.serve:
+        from core.deck_service import serve
+        serve(generator, args.host, args.port, config['SERVER_WORKERS'], config['SERVER_QUEUE_SIZE'])
+        return
+
+    # Generate PPT
+    ppt_file = generator.generate_presentation(args.topic, args.slides, use_deck_cache=not args.no_deck_cache)
     print(f"Presentation generated: {ppt_file}")
 
+    stats = generator.deck_cache_stats()
+    if stats:
+        print(f"Deck cache: {stats['hits']} of {stats['lookups']} presentations served from the cache "
+              f"({stats['hit_rate']:.0%})")
+    if config['TRACING'] and config['TRACE_FILE']:
+        tracer.write_chrome_trace(config['TRACE_FILE'])
+        print(f"Trace written: {config['TRACE_FILE']}")
+
+    stats = generator.ai_requester.cache_stats()
+    if stats:
+        print(f"LLM memory cache: {stats['hits']} hits, {stats['misses']} misses, "
+              f"{stats['evictions']} evictions, {stats['entries']} entries ({stats['bytes']} bytes)")
+
+    stats = generator.ai_requester.similarity_stats()
+    if stats:
+        print(f"Similarity cache: {stats['hits']} of {stats['lookups']} slide texts reused "
+              f"at threshold {stats['threshold']}, {stats['entries']} entries")
+
+    llm, images = generator.ai_requester.flight_stats(), generator.image_searcher.flight_stats()
+    print(f"Coalesced requests: {llm['coalesced']} of {llm['calls'] + llm['coalesced']} LLM requests, "
+          f"{images['coalesced']} of {images['calls'] + images['coalesced']} image downloads")
+
+    for backend, stats in generator.ai_requester.scheduler_stats().items():
+        if stats['wait_seconds_max']:
+            print(f"Rate limits of {backend}: {stats['granted']} requests waited {stats['mean_wait_seconds']:.2f}s "
+                  f"on average, {stats['wait_seconds_max']:.2f}s at most")
+
+    stats = generator.ai_requester.backend_stats()
+    if len(stats) > 1:
+        for backend in stats:
+            latency = ', '.join(f"{role} {seconds:.2f}s" for role, seconds in backend['latency'].items()) or '-'
+            print(f"Backend {backend['name']}: {backend['requests']} requests, {backend['errors']} errors, latency {latency}")
+
+def print_storage(stats):
+    """
+    Print the entries, sizes and access ages of the caches and the size of the image folders.
+    """
+    for name in ('llm', 'web', 'images', 'decks'):
+        cache = stats[name]
+        windows = ', '.join(f"{count} within {window}" for window, count in cache['accessed_within'].items())
+        age = f"{cache['oldest_age_seconds'] / 86400:.1f} days" if cache['oldest_age_seconds'] is not None else '-'
+        print(f"{name} cache: {cache['entries']} entries ({cache['bytes']} bytes, {cache['file_bytes']} on disk), "
+              f"oldest {age}, {cache['hit_entries']} hit, accessed {windows}")
+    if 'similarity' in stats:
+        print(f"similarity cache: {stats['similarity']['entries']} entries ({stats['similarity']['file_bytes']} bytes on disk)")
+    for name in ('image_files', 'processed_files'):
+        print(f"{name.replace('_', ' ')}: {stats[name]['files']} files ({stats[name]['bytes']} bytes)")
+
 if __name__ == "__main__":
     main()
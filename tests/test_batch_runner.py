@@ -0,0 +1,30 @@
+# test_batch_runner.py
+import pytest
+from core.batch_runner import read_topics
+
+
+def test_read_topics(tmp_path):
+    topics_file = tmp_path / 'topics.csv'
+    topics_file.write_text("topic,slides,output\nSolar power,5,\nWind power,3,wind.pptx\n")
+
+    assert read_topics(str(topics_file)) == [
+        {'topic': 'Solar power', 'slides': 5, 'output': 'Solar_power_5.pptx'},
+        {'topic': 'Wind power', 'slides': 3, 'output': 'wind.pptx'},
+    ]
+
+
+@pytest.mark.parametrize('name, content, message', [
+    ('topics.csv', "topic\nSolar power\n", "Line 2 of .* has no slides"),
+    ('topics.csv', "topic,slides\nSolar power,5\n,3\n", "Line 3 of .* has no topic"),
+    ('topics.jsonl', '{"topic": "Solar power", "slides": 5}\n\n{"slides": 3}\n', "Line 3 of .* has no topic"),
+    ('topics.jsonl', '{"topic": "Solar power", "slides": "five"}\n', "Line 1 of .* has an invalid slide count"),
+    ('topics.jsonl', '["Solar power", 5]\n', "Line 1 of .* is not a JSON object"),
+    ('topics.jsonl', '{"topic": "Solar power", "slides": 5}\n{"topic": "Solar power", "slides": 5}\n',
+     "Lines 1 and 2 of .* are both written to Solar_power_5.pptx"),
+])
+def test_read_topics_rejects_invalid_decks(tmp_path, name, content, message):
+    topics_file = tmp_path / name
+    topics_file.write_text(content)
+
+    with pytest.raises(ValueError, match=message):
+        read_topics(str(topics_file))
@@ -0,0 +1,20 @@
+# test_image_processor.py
+from PIL import Image
+from core.image_processor import ImageProcessor, EMU_PER_INCH
+
+
+def test_rotated_photo_is_transposed(tmp_path):
+    # A landscape sensor image tagged to be displayed rotated 90 degrees clockwise
+    source = tmp_path / 'rotated.jpg'
+    image = Image.new('RGB', (4000, 3000), 'white')
+    exif = image.getexif()
+    exif[0x0112] = 6
+    image.save(source, 'JPEG', exif=exif, quality=95)
+
+    processor = ImageProcessor({'IMAGES_PATH': str(tmp_path), 'IMAGE_DPI': 100})
+    variant_path = processor.prepare(str(source), 3 * EMU_PER_INCH, 4 * EMU_PER_INCH)
+
+    assert variant_path != str(source)
+    with Image.open(variant_path) as variant:
+        assert variant.size == (300, 400)
+        assert 0x0112 not in variant.getexif()
@@ -0,0 +1,79 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# Third-party modules that must only be imported on first use
+HEAVY_MODULES = ['pptx', 'lxml', 'icrawler', 'duckduckgo_search', 'bs4', 'httpx', 'PIL', 'openai', 'requests']
+
+# Modules imported by the CLI before it knows which features are used
+DEFAULT_TARGETS = ['manager', 'core.slides_generator', 'core.deck_service', 'core.batch_runner']
+
+# Import a module in a fresh interpreter and report its import time and the heavy modules it loaded
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+loaded = [name for name in {heavy!r} if name in sys.modules]
+print(json.dumps({{'seconds': seconds, 'loaded': loaded}}))
+"""
+
+def probe(module, python):
+    output = subprocess.run([python, '-c', PROBE.format(module=module, heavy=HEAVY_MODULES)], cwd=ROOT,
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+# Slowest imports of a module, from the cumulative times of python -X importtime
+def slowest_imports(module, python, top):
+    stderr = subprocess.run([python, '-X', 'importtime', '-c', f"import {module}"], cwd=ROOT,
+                            capture_output=True, text=True, check=True).stderr
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        imports.append((int(cumulative), name.strip()))
+    return sorted(imports, reverse=True)[:top]
+
+# Main function to handle argparse, measure the imports and check the budget
+def main():
+    parser = argparse.ArgumentParser(description='Measure the import time of the CLI modules and check that heavy dependencies are loaded lazily.')
+    parser.add_argument('--modules', nargs='+', default=DEFAULT_TARGETS, help='Modules to import')
+    parser.add_argument('--repeat', type=int, default=5, help='Imports per module, the fastest one is kept')
+    parser.add_argument('--budget-ms', type=float, default=200, help='Maximum import time of each module, in ms')
+    parser.add_argument('--top', type=int, default=0, help='Also list the slowest imports of each module')
+    parser.add_argument('--python', type=str, default=sys.executable, help='Interpreter to measure')
+    parser.add_argument('--output', type=str, help='Write the results as JSON to this file')
+    args = parser.parse_args()
+
+    results, failures = [], []
+    print(f"{'module':<28} {'best ms':>8}  heavy modules loaded")
+    for module in args.modules:
+        runs = [probe(module, args.python) for _ in range(args.repeat)]
+        best = min(run['seconds'] for run in runs) * 1000
+        loaded = sorted({name for run in runs for name in run['loaded']})
+        results.append({'module': module, 'best_ms': round(best, 2), 'loaded': loaded})
+        print(f"{module:<28} {best:>8.1f}  {', '.join(loaded) or '-'}")
+
+        if best > args.budget_ms:
+            failures.append(f"{module} imports in {best:.1f} ms, over the {args.budget_ms:.0f} ms budget")
+        if loaded:
+            failures.append(f"{module} imports {', '.join(loaded)} eagerly")
+        for cumulative, name in slowest_imports(module, args.python, args.top) if args.top else []:
+            print(f"    {cumulative / 1000:>8.1f} ms  {name}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'budget_ms': args.budget_ms, 'results': results}, f, indent=4)
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+# Execute the script
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from core.slide_parser import SlideParser
+
+# Function to build a synthetic outline of the given number of slides
+def build_outline(slides, seed=0):
+    rng = random.Random(seed)
+    words = "the market grows as teams adopt [AI] tools to automate reports and plans".split()
+    parts = ["[L_TS]\n[TITLE]Synthetic Deck[/TITLE]\n[SUBTITLE]Benchmark[/SUBTITLE]\n"]
+    for i in range(slides):
+        bullets = "\n".join("- " + " ".join(rng.choices(words, k=12)) for _ in range(4))
+        layout = rng.choice(["[L_CS]", "[L_IS]", "[L_TCS]"])
+        if layout == "[L_TCS]":
+            body = f"[CONTENT]\n{bullets}\n[/CONTENT]\n[CONTENT]\n{bullets}\n[/CONTENT]"
+        elif layout == "[L_IS]":
+            body = f"[CONTENT]\n{bullets}\n[/CONTENT]\n[IMAGE]picture {i}[/IMAGE]"
+        else:
+            body = f"[CONTENT]\n{bullets}\n[/CONTENT]"
+        parts.append(f"{layout}\n[TITLE]Slide {i}[/TITLE]\n{body}\n")
+    parts.append("[L_THS]\n[TITLE]Thanks[/TITLE]\n")
+    return "\n[SLIDEBREAK]\n\n".join(parts)
+
+# Previous parser: split on [SLIDEBREAK], then one str.find scan per tag and slide
+def legacy_parse(content):
+    def extract(text, start_tag, end_tag):
+        start = text.find(start_tag)
+        end = text.find(end_tag)
+        if start != -1 and end != -1:
+            return text[start + len(start_tag):end].strip()
+        return ""
+
+    def extract_all(text, start_tag, end_tag):
+        contents, start = [], 0
+        while True:
+            start = text.find(start_tag, start)
+            if start == -1:
+                break
+            end = text.find(end_tag, start + len(start_tag))
+            if end == -1:
+                break
+            contents.append(text[start + len(start_tag):end].strip())
+            start = end + len(end_tag)
+        return contents
+
+    slides = []
+    for slide in content.split("[SLIDEBREAK]"):
+        layout = next((tag for tag in ["[L_TS]", "[L_CS]", "[L_IS]", "[L_THS]", "[L_TCS]"] if tag in slide), None)
+        slides.append((layout, extract(slide, "[TITLE]", "[/TITLE]"), extract(slide, "[SUBTITLE]", "[/SUBTITLE]"),
+                       extract_all(slide, "[CONTENT]", "[/CONTENT]"), extract(slide, "[IMAGE]", "[/IMAGE]")))
+    return slides
+
+# Previous streamed parser: buffer the chunks and split on [SLIDEBREAK], then parse each slide
+def legacy_parse_chunks(content, chunk_size):
+    slides, buffer = [], ""
+    for i in range(0, len(content), chunk_size):
+        buffer += content[i:i + chunk_size]
+        *complete, buffer = buffer.split("[SLIDEBREAK]")
+        for slide in complete:
+            slides.extend(legacy_parse(slide))
+    return slides + legacy_parse(buffer)
+
+def parse_chunks(content, chunk_size):
+    parser = SlideParser()
+    slides = []
+    for i in range(0, len(content), chunk_size):
+        slides.extend(parser.feed(content[i:i + chunk_size]))
+    return slides + parser.close()
+
+def best_time(function, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+# Main function to handle argparse and print the timings
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the slide markup parser on synthetic outlines.')
+    parser.add_argument('--slides', type=int, nargs='+', default=[100, 1000, 10000], help='Outline sizes in slides')
+    parser.add_argument('--chunk', type=int, default=16, help='Chunk size of the streamed parse, in characters')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per measure, the best one is kept')
+    args = parser.parse_args()
+
+    print(f"{'slides':>8} {'chars':>10} {'legacy ms':>10} {'parser ms':>10} {'legacy streamed ms':>19} {'streamed ms':>12}")
+    for slides in args.slides:
+        content = build_outline(slides)
+        assert len(SlideParser().parse(content)) == slides + 2
+        assert len(parse_chunks(content, args.chunk)) == slides + 2
+
+        legacy = best_time(lambda: legacy_parse(content), args.repeat)
+        single = best_time(lambda: SlideParser().parse(content), args.repeat)
+        legacy_streamed = best_time(lambda: legacy_parse_chunks(content, args.chunk), args.repeat)
+        streamed = best_time(lambda: parse_chunks(content, args.chunk), args.repeat)
+        print(f"{slides:>8} {len(content):>10} {legacy * 1000:>10.2f} {single * 1000:>10.2f} "
+              f"{legacy_streamed * 1000:>19.2f} {streamed * 1000:>12.2f}")
+
+# Execute the script
+if __name__ == "__main__":
+    main()
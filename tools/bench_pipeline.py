@@ -0,0 +1,242 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from PIL import Image
+from config import load_config
+from core.deck_writer import DeckWriter
+from core.slides_generator import SlidesGenerator
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+WRITER_SAVE = DeckWriter.save
+
+# Fake image source: the same picture for every query, with the query appended after the end of the
+# JPEG data so that each query gets its own content hash without paying for a new encoding
+class FakeImageFetcher:
+    def __init__(self, latency, size):
+        self.latency = latency
+        buffer = io.BytesIO()
+        Image.linear_gradient('L').resize(size).convert('RGB').save(buffer, 'JPEG', quality=90)
+        self.image = buffer.getvalue()
+
+    def fetch(self, query):
+        time.sleep(self.latency)
+        return self.image + query.encode('utf-8'), 'jpg'
+
+# Fake web search backend returning canned results
+class FakeSearchBackend:
+    def __init__(self, latency):
+        self.latency = latency
+
+    def search(self, query, max_results):
+        time.sleep(self.latency)
+        return [{'title': f"{query} result {number}", 'href': f"https://example.com/{number}",
+                 'body': f"Facts about {query}, number {number}."} for number in range(max_results)]
+
+# Durations of the calls of each stage, stages run concurrently so their totals overlap
+class StageTimer:
+    def __init__(self):
+        self.durations = defaultdict(list)
+        self.lock = threading.Lock()
+
+    def record(self, stage, seconds):
+        with self.lock:
+            self.durations[stage].append(seconds)
+
+    def wrap(self, stage, function):
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.record(stage, time.perf_counter() - start)
+        return timed
+
+    def wrap_stream(self, stage, function):
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                yield from function(*args, **kwargs)
+            finally:
+                self.record(stage, time.perf_counter() - start)
+        return timed
+
+    def summary(self):
+        summary = {}
+        for stage, durations in sorted(self.durations.items()):
+            durations = sorted(durations)
+            summary[stage] = {
+                'calls': len(durations),
+                'total_ms': round(sum(durations) * 1000, 2),
+                'mean_ms': round(sum(durations) / len(durations) * 1000, 2),
+                'p50_ms': round(durations[len(durations) // 2] * 1000, 2),
+                'p95_ms': round(durations[min(len(durations) - 1, int(len(durations) * 0.95))] * 1000, 2),
+                'max_ms': round(durations[-1] * 1000, 2),
+            }
+        return summary
+
+# Build a generator on fresh cache folders with the stub provider and the fake image and search sources
+def build_generator(args, workers, work_dir, timer):
+    config = load_config()
+    config.update({
+        'PROVIDER': 'stub',
+        'MODEL': 'stub',
+        'API_KEY': None,
+        'STUB_LATENCY': args.latency,
+        'STUB_CHUNK_LATENCY': args.chunk_latency,
+        'PROVIDER_CONCURRENCY': workers,
+        'OUTPUT_PATH': os.path.join(work_dir, 'output'),
+        'IMAGES_PATH': os.path.join(work_dir, 'images'),
+        'TEMPLATE': os.path.join(ROOT, 'templates', 'template0.pptx'),
+        'MAX_WORKERS': workers,
+        'IMAGE_WORKERS': workers,
+        'STREAMING': args.streaming,
+        'BATCH_SIZE': args.batch_size,
+        'WEB_SEARCH_LLM_FORMAT': False,
+        'INCREMENTAL': False,
+        'DECK_CACHE': False,
+        'LARGE_DECK': args.large_deck,
+    })
+    os.makedirs(config['OUTPUT_PATH'], exist_ok=True)
+    os.makedirs(config['IMAGES_PATH'], exist_ok=True)
+
+    generator = SlidesGenerator(config, search_backend=FakeSearchBackend(args.search_latency))
+    generator.image_searcher.fetcher = FakeImageFetcher(args.image_latency, tuple(args.image_size))
+
+    # Time each stage of the pipeline
+    backend = generator.ai_requester.backend
+    complete, stream = backend.complete, backend.stream
+    backend.complete = lambda message, role='expansion', job=None: timer.wrap(stage_of(message), complete)(message, role, job)
+    backend.stream = lambda message, role='expansion', job=None: timer.wrap_stream(stage_of(message), stream)(message, role, job)
+    generator.search_backend.search = timer.wrap('web_search', generator.search_backend.search)
+    generator.image_searcher.fetcher.fetch = timer.wrap('image_fetch', generator.image_searcher.fetcher.fetch)
+    generator.image_processor.prepare = timer.wrap('image_processing', generator.image_processor.prepare)
+    generator._render_slide = timer.wrap('render', generator._render_slide)
+
+    load_template = generator._load_template
+    def timed_load_template():
+        presentation = timer.wrap('template', load_template)()
+        presentation.save = timer.wrap('save', presentation.save)
+        return presentation
+    generator._load_template = timed_load_template
+    # Large decks are saved by a deck writer created for each deck
+    DeckWriter.save = timer.wrap('save', WRITER_SAVE)
+    return generator
+
+def stage_of(message):
+    return 'llm_outline' if 'slides long' in message else 'llm_slide_text'
+
+# Generate the decks of one benchmark point, each deck on cold caches
+def run_point(args, slides, workers):
+    timer = StageTimer()
+    deck_seconds = []
+    peak_memory = 0
+    for deck in range(args.decks):
+        work_dir = tempfile.mkdtemp(prefix='bench_pipeline_')
+        try:
+            generator = build_generator(args, workers, work_dir, timer)
+            if args.memory:
+                tracemalloc.start()
+            output = io.StringIO() if not args.verbose else sys.stdout
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(output):
+                generator.generate_presentation(f"Benchmark topic {deck}", slides, filename='deck.pptx')
+            deck_seconds.append(time.perf_counter() - start)
+            if args.memory:
+                peak_memory = max(peak_memory, tracemalloc.get_traced_memory()[1])
+                tracemalloc.stop()
+            generator.image_searcher.executor.shutdown()
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    wall = sum(deck_seconds)
+    return {
+        'slides': slides,
+        'workers': workers,
+        'decks': args.decks,
+        'deck_seconds': [round(seconds, 4) for seconds in deck_seconds],
+        'mean_deck_seconds': round(wall / len(deck_seconds), 4),
+        'decks_per_minute': round(60 * len(deck_seconds) / wall, 2),
+        'peak_memory_bytes': peak_memory if args.memory else None,
+        'stages': timer.summary(),
+    }
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+# Print the decks per minute of each point against a previous results file
+def compare(results, previous_file):
+    with open(previous_file, 'r') as f:
+        previous = json.load(f)
+    baseline = {(point['slides'], point['workers']): point for point in previous['results']}
+    print(f"\nCompared with {previous_file} (commit {previous.get('commit')}):")
+    for point in results:
+        before = baseline.get((point['slides'], point['workers']))
+        if before:
+            print(f"{point['slides']:>8} slides {point['workers']:>4} workers: {before['decks_per_minute']:>8.2f} -> "
+                  f"{point['decks_per_minute']:>8.2f} decks/min ({point['decks_per_minute'] / before['decks_per_minute']:.2f}x)")
+
+# Main function to handle argparse, run the sweep and write the results
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the presentation pipeline with a stub LLM and fake image and search sources.')
+    parser.add_argument('--slides', type=int, nargs='+', default=[5, 20, 50, 200], help='Deck sizes in slides')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 4, 8, 16], help='MAX_WORKERS levels')
+    parser.add_argument('--decks', type=int, default=3, help='Decks generated per point, each on cold caches')
+    parser.add_argument('--latency', type=float, default=0.05, help='Latency of an LLM request, in seconds')
+    parser.add_argument('--chunk-latency', type=float, default=0.0, help='Latency of each streamed LLM chunk, in seconds')
+    parser.add_argument('--image-latency', type=float, default=0.05, help='Latency of an image download, in seconds')
+    parser.add_argument('--image-size', type=int, nargs=2, default=[1600, 1200], help='Size of the fake images')
+    parser.add_argument('--search-latency', type=float, default=0.1, help='Latency of the web search, in seconds')
+    parser.add_argument('--streaming', action='store_true', help='Stream the outline')
+    parser.add_argument('--batch-size', type=int, default=1, help='BATCH_SIZE of the slide texts')
+    parser.add_argument('--large-deck', action='store_true', help='Checkpoint the slides and stream the images into the file')
+    parser.add_argument('--no-memory', dest='memory', action='store_false', help='Do not trace the peak memory')
+    parser.add_argument('--output', type=str, default='bench_pipeline.json', help='Path of the JSON results')
+    parser.add_argument('--compare', type=str, help='Previous JSON results to compare with')
+    parser.add_argument('--verbose', action='store_true', help='Show the output of the generator')
+    args = parser.parse_args()
+
+    print(f"{'slides':>8} {'workers':>8} {'deck s':>8} {'decks/min':>10} {'peak MB':>8}  slowest stages (total ms)")
+    results = []
+    for slides in args.slides:
+        for workers in args.workers:
+            point = run_point(args, slides, workers)
+            results.append(point)
+            stages = sorted(point['stages'].items(), key=lambda item: -item[1]['total_ms'])[:3]
+            peak = f"{point['peak_memory_bytes'] / 1e6:.1f}" if args.memory else '-'
+            print(f"{slides:>8} {workers:>8} {point['mean_deck_seconds']:>8.3f} {point['decks_per_minute']:>10.2f} "
+                  f"{peak:>8}  " + ", ".join(f"{stage} {summary['total_ms']:.0f}" for stage, summary in stages))
+
+    report = {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'created_at': time.time(),
+        'settings': {key: value for key, value in vars(args).items() if key not in ('output', 'compare', 'verbose')},
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=4)
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+# Execute the script
+if __name__ == "__main__":
+    main()
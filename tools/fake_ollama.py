@@ -0,0 +1,70 @@
+import argparse
+import json
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Local stand-in for the Ollama generate endpoint, to run the app without a model
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, as the real server
+    latency = 0.0
+    failures = 0
+    response_text = "[L_TS]\n[TITLE]Fake Presentation[/TITLE]\n[SUBTITLE]Generated offline[/SUBTITLE]\n[SLIDEBREAK]\n[L_THS]\n[TITLE]Thanks[/TITLE]"
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if self.path != '/api/generate':
+            self._send(404, b'{"error": "not found"}')
+            return
+
+        # Fail the first requests to exercise the client retries
+        if FakeOllamaHandler.failures > 0:
+            FakeOllamaHandler.failures -= 1
+            self._send(503, b'{"error": "overloaded"}')
+            return
+
+        request = json.loads(body or b'{}')
+        time.sleep(self.latency)
+        if request.get('stream'):
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/x-ndjson')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            words = self.response_text.split(' ')
+            for i, word in enumerate(words):
+                chunk = {"response": word if i == 0 else ' ' + word, "done": False}
+                self._write_chunk(json.dumps(chunk).encode() + b'\n')
+            self._write_chunk(json.dumps({"response": "", "done": True}).encode() + b'\n')
+            self._write_chunk(b'')
+        else:
+            self._send(200, json.dumps({"response": self.response_text, "done": True}).encode())
+
+    def _send(self, status, body):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _write_chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve a fake Ollama generate endpoint.')
+    parser.add_argument('--port', type=int, default=11434, help='Port to listen on')
+    parser.add_argument('--latency', type=float, default=0.0, help='Delay in seconds before each response')
+    parser.add_argument('--failures', type=int, default=0, help='Number of requests answered with a 503 first')
+    parser.add_argument('--response', type=str, help='File holding the text returned for every prompt')
+    args = parser.parse_args()
+
+    FakeOllamaHandler.latency = args.latency
+    FakeOllamaHandler.failures = args.failures
+    if args.response:
+        with open(args.response, 'r') as f:
+            FakeOllamaHandler.response_text = f.read()
+
+    server = ThreadingHTTPServer(('127.0.0.1', args.port), FakeOllamaHandler)
+    print(f"Fake Ollama server listening on http://127.0.0.1:{args.port}")
+    server.serve_forever()
+
+if __name__ == "__main__":
+    main()
@@ -1,37 +1,54 @@
 import argparse
-from pptx import Presentation
+import os
+import sys
+from pptx.enum.shapes import PP_PLACEHOLDER
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from core.template_registry import TemplateRegistry
 
 # Function to list all layouts and placeholders
-def list_layouts_and_placeholders(pptx_file):
-    # Open the presentation
-    presentation = Presentation(pptx_file)
-    
-    print(f"Total number of slide layouts: {len(presentation.slide_layouts)}\n")
-    
-    # Iterate through each slide layout in the presentation
-    for idx, layout in enumerate(presentation.slide_layouts):
-        print(f"Slide Layout {idx}: {layout.name}")
-        
+def list_layouts_and_placeholders(pptx_file, index_path=None):
+    # Parse the template and build its layout index
+    template = TemplateRegistry(index_path).get(pptx_file)
+    lines = [f"Total number of slide layouts: {len(template.layouts)}\n"]
+
+    # Iterate through each slide layout in the index
+    for layout in template.layouts:
+        lines.append(f"Slide Layout {layout['index']}: {layout['name']}")
+
         # Get all placeholders in the layout
-        placeholders = layout.placeholders
-        if placeholders:
-            for placeholder in placeholders:
-                print(f"\tPlaceholder {placeholder.placeholder_format.idx}: {placeholder.name}, Type: {placeholder.placeholder_format.type}")
+        if layout['placeholders']:
+            for placeholder in layout['placeholders']:
+                placeholder_type = PP_PLACEHOLDER[placeholder['type']] if placeholder['type'] else None
+                lines.append(f"\tPlaceholder {placeholder['idx']}: {placeholder['name']}, Type: {placeholder_type}")
         else:
-            print("\tNo placeholders in this layout")
-        print("\n")
+            lines.append("\tNo placeholders in this layout")
+        lines.append("\n")
+
+    # Layouts used by the LayoutManager for each slide role
+    lines.append("Layout roles:")
+    for role, layout_index in template.roles.items():
+        lines.append(f"\t{role}: Slide Layout {layout_index}")
+    return "\n".join(lines)
 
 # Main function to handle argparse and calling the function
 def main():
     # Set up argument parser
     parser = argparse.ArgumentParser(description='List all slide layouts and placeholders in a PPTX file.')
     parser.add_argument('pptx_file', type=str, help='Path to the PPTX file')
+    parser.add_argument('--output', type=str, help='Write the listing to this file, e.g. templates/layout.cfg')
+    parser.add_argument('--index-path', type=str, help='Folder of the cached layout indexes')
 
     # Parse the command-line arguments
     args = parser.parse_args()
 
     # Call the function with the provided pptx file
-    list_layouts_and_placeholders(args.pptx_file)
+    listing = list_layouts_and_placeholders(args.pptx_file, args.index_path)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(listing)
+    else:
+        print(listing)
 
 # Execute the script
 if __name__ == "__main__":